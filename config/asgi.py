@@ -3,6 +3,13 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run it with an ASGI server and async dashboard views, e.g.
+``ASYNC_VIEWS=True uvicorn config.asgi:application --workers 4``.
+
+The middleware chain stays synchronous under ASGI: WhiteNoise is sync-only,
+so Django runs the chain in a worker thread through its sync adapter, and
+only async views hop back onto the event loop.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -0,0 +1,151 @@
+"""
+Primary/replica read routing and the SQLite performance profile.
+
+Views decorated with read_from_replica send their reads to the
+REPLICA_DATABASE alias, a Postgres replica or a read-only connection to the
+SQLite file. Writes always go to default, the primary. After a request wrote,
+PrimaryStickinessMiddleware pins that browser's reads to the primary for
+READ_YOUR_WRITES_SECONDS, so a lagging replica never hides the user's change.
+
+Every new SQLite connection gets SQLITE_PRAGMAS, and with
+SQLITE_IMMEDIATE_TRANSACTIONS atomic blocks take the write lock up front.
+"""
+import functools
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+REPLICA_DATABASE = 'replica'
+
+# Holds an expiry timestamp, set on responses to requests that wrote
+PRIMARY_COOKIE = 'read_primary_until'
+
+# Alias reads are routed to in the current request, None for the default
+_read_database = ContextVar('read_database', default=None)
+
+# The current request's RequestWrites, set by PrimaryStickinessMiddleware
+_request_writes = ContextVar('request_writes', default=None)
+
+
+class RequestWrites:
+    """Whether the request reads from the primary and whether it wrote"""
+
+    def __init__(self, read_primary):
+        self.read_primary = read_primary
+        self.wrote = False
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created receiver applying SQLITE_PRAGMAS to SQLite connections"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+        if connection.alias == REPLICA_DATABASE:
+            # Opened read-only, this makes a misrouted write fail loudly rather than lock
+            cursor.execute('PRAGMA query_only = 1')
+
+    if connection.alias != REPLICA_DATABASE and getattr(settings, 'SQLITE_IMMEDIATE_TRANSACTIONS', False):
+        # A deferred transaction that reads first and then writes can't wait for the
+        # lock, SQLite fails it at once with "database is locked" despite busy_timeout
+        connection._start_transaction_under_autocommit = lambda: connection.cursor().execute('BEGIN IMMEDIATE')
+
+
+def replica_configured():
+    if REPLICA_DATABASE not in settings.DATABASES:
+        return False
+    # Test runs mirror the alias onto default, reading through default keeps test transactions visible
+    return connections[REPLICA_DATABASE].settings_dict['NAME'] != connections['default'].settings_dict['NAME']
+
+
+def reading_from_replica():
+    return _read_database.get() is not None
+
+
+def _replica_for_request():
+    writes = _request_writes.get()
+    if writes is not None and writes.read_primary:
+        return None
+    return REPLICA_DATABASE if replica_configured() else None
+
+
+def read_from_replica(view):
+    """Route the view's reads to the replica, unless the user wrote moments ago"""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            # Context variables follow the view into sync_to_async threads
+            token = _read_database.set(_replica_for_request())
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_database.reset(token)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _read_database.set(_replica_for_request())
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_database.reset(token)
+    return wrapper
+
+
+class ReadReplicaRouter:
+    """Reads go to the alias chosen by read_from_replica, everything else to default"""
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        writes = _request_writes.get()
+        if writes is not None:
+            writes.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+class PrimaryStickinessMiddleware:
+    """Read your own writes: after a request wrote, read from the primary for a short while"""
+
+    # Sync only, the chain below it ends in the sync-only WhiteNoise middleware anyway
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            read_primary = float(request.COOKIES.get(PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            read_primary = False
+
+        writes = RequestWrites(read_primary)
+        token = _request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_writes.reset(token)
+
+        if writes.wrote and replica_configured():
+            seconds = settings.READ_YOUR_WRITES_SECONDS
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                str(time.time() + seconds),
+                max_age=seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
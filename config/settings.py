@@ -57,12 +57,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'dashboard.middleware.RequestProfilingMiddleware',
+    'habits.middleware.RequestMetricsMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    'habits.middleware.AchievementNotificationMiddleware',
+    # Inside the notification middleware, so only the view's own writes pin reads to the primary
+    'config.database.PrimaryStickinessMiddleware',
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     'whitenoise.middleware.WhiteNoiseMiddleware',
 ]
@@ -156,13 +161,88 @@ if os.environ.get('DATABASE_URL'):
             ssl_require=True,
         )
     }
+    # Read-only views read from this replica, see config/database.py
+    if os.environ.get('DATABASE_REPLICA_URL'):
+        DATABASES['replica'] = dj_database_url.config(
+            env='DATABASE_REPLICA_URL',
+            conn_max_age=600,
+            conn_health_checks=True,
+            ssl_require=True,
+            test_options={'MIRROR': 'default'},
+        )
 else:
+    SQLITE_NAME = os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3')
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+            # SQLITE_PATH points load tests and benchmarks at a scratch database
+            'NAME': SQLITE_NAME,
         }
     }
+    
+    # SQLite performance profile, see config/database.py. WAL lets readers
+    # run alongside a writer, analytics and dashboard reads use a separate
+    # read-only connection so they don't queue behind habit completions
+    if os.environ.get('SQLITE_PERFORMANCE', 'True') == 'True':
+        SQLITE_PRAGMAS = {
+            'journal_mode': 'wal',
+            # Durable at checkpoints rather than every commit, safe with WAL
+            'synchronous': 'normal',
+            'mmap_size': 256 * 1024 * 1024,
+            # Milliseconds a writer waits for the lock before "database is locked"
+            'busy_timeout': 5000,
+        }
+        SQLITE_IMMEDIATE_TRANSACTIONS = True
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': Path(SQLITE_NAME).resolve().as_uri() + '?mode=ro',
+            'OPTIONS': {'uri': True},
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_ROUTERS = ['config.database.ReadReplicaRouter']
+
+# After a write, the user's reads stay on the primary this long, covering replica lag
+READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', '5'))
+
+# Deferred jobs
+# When True, achievement checks are queued for `python manage.py process_jobs`
+# instead of running inside the request
+DEFERRED_JOBS = os.environ.get('DEFERRED_JOBS', 'False') == 'True'
+
+# Request profiling
+# Adds Server-Timing headers and keeps the last REQUEST_PROFILING_BUFFER
+# requests per process for the staff-only /debug/perf/ page
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING', 'False') == 'True'
+REQUEST_PROFILING_BUFFER = int(os.environ.get('REQUEST_PROFILING_BUFFER', '200'))
+
+# Prometheus metrics, served at /metrics
+# Under gunicorn, gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR so all workers are aggregated
+PROMETHEUS_METRICS = os.environ.get('PROMETHEUS_METRICS', 'True') == 'True'
+# Scrapers send `Authorization: Bearer <METRICS_TOKEN>` or connect from an address in
+# the comma separated METRICS_ALLOWED_IPS, anyone else gets a 404
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
+# Async views
+# Serve the dashboard and analytics from async views, for ASGI servers such as
+# `uvicorn config.asgi:application`. Their independent parts run concurrently on
+# a pool of ASYNC_VIEW_THREADS threads per process, 0 runs them one after another
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+ASYNC_VIEW_THREADS = int(os.environ.get('ASYNC_VIEW_THREADS', '4'))
+
+# Cache
+# File based so every gunicorn worker on the host sees the same dashboard
+# snapshots and data versions, per-process locmem would serve stale pages
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / '.cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
 
 # WhiteNoise Configuration
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
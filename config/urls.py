@@ -1,9 +1,20 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
 from users import views as user_views
 from dashboard import views as dashboard_views
 from dashboard import analytics_views
+from dashboard import async_views
+from dashboard import debug_views
+from dashboard import export_views
+from habits import api_views
+
+# Under an ASGI server the dashboard and analytics fetch their parts concurrently
+if settings.ASYNC_VIEWS:
+    dashboard_view, analytics_view = async_views.dashboard, async_views.analytics
+else:
+    dashboard_view, analytics_view = dashboard_views.dashboard, analytics_views.analytics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -14,8 +25,14 @@ urlpatterns = [
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     
     # Dashboard
-    path('', dashboard_views.dashboard, name='dashboard'),
-    path('analytics/', analytics_views.analytics, name='analytics'),
+    path('', dashboard_view, name='dashboard'),
+    path('analytics/', analytics_view, name='analytics'),
+    path('export/', export_views.export_data, name='export'),
+    path('debug/perf/', debug_views.perf_report, name='perf-report'),
+    path('metrics', debug_views.metrics, name='metrics'),
+    
+    # Offline sync API
+    path('api/sync/', api_views.sync_view, name='api-sync'),
     
     # Habits URLs
     path('habits/', include('habits.urls')),
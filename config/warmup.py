@@ -0,0 +1,55 @@
+"""
+Warmup for server processes, so the first requests don't pay one-off costs.
+
+Template compilation and URL resolving are cached per process: under gunicorn
+with preload_app they are done once in the master and shared by every forked
+worker. Database connections can't cross a fork, so each worker opens its own.
+"""
+import time
+from pathlib import Path
+
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver, reverse
+
+
+def compile_templates():
+    """Load every template of the project's template directories into the cached loader"""
+    count = 0
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        if engine is None:
+            continue
+        for directory in engine.dirs:
+            for path in sorted(Path(directory).rglob('*.html')):
+                engine.get_template(path.relative_to(directory).as_posix())
+                count += 1
+    return count
+
+
+def load_urls():
+    """Import every view module and build the URL resolver's lookup tables"""
+    resolver = get_resolver()
+    # reverse() populates the resolver, including included URLconfs
+    reverse('dashboard')
+    return len(resolver.reverse_dict)
+
+
+def open_connections():
+    """Connect to every configured database from this process"""
+    for alias in connections:
+        connections[alias].ensure_connection()
+    return list(connections)
+
+
+def warmup(connect=True):
+    """Run the warmup steps, returning each step's duration in milliseconds"""
+    timings = {}
+    steps = [('templates', compile_templates), ('urls', load_urls)]
+    if connect:
+        steps.append(('connections', open_connections))
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
@@ -1,42 +1,80 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from habits.models import Habit, HabitCompletion, Achievement
+from habits.models import Habit, HabitCompletion, Achievement, DailyUserStats
 from todos.models import Todo
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Count, Q
+from django.db.models import Count, Min, Q
 from collections import defaultdict
+from habits.metrics import ANALYTICS_BUILD_LATENCY
+from .completion_matrix import CompletionMatrix
+from config.database import read_from_replica
+from .snapshot_cache import conditional_on_data_version
 import json
 
+# Selectable ranges: key -> (label, days or None for all time)
+ANALYTICS_RANGES = {
+    '30': ('30 Days', 30),
+    '90': ('90 Days', 90),
+    '365': ('1 Year', 365),
+    'all': ('All Time', None),
+}
+
 @login_required
+@conditional_on_data_version
+@read_from_replica
 def analytics(request):
-    user = request.user
+    range_key = request.GET.get('range', '30')
+    if range_key not in ANALYTICS_RANGES:
+        range_key = '30'
+    
+    context = build_analytics_context(request.user, range_key)
+    return render(request, 'dashboard/analytics.html', context)
+
+@ANALYTICS_BUILD_LATENCY.time()
+def build_analytics_context(user, range_key='30'):
+    """Analytics context for one of ANALYTICS_RANGES"""
+    context = {}
+    for part in analytics_parts(range_key):
+        context.update(part(user))
+    return context
+
+def analytics_parts(range_key):
+    """Independent parts of the analytics context, the async view fetches them concurrently"""
+    return [
+        lambda user: habit_analytics(user, range_key),
+        completion_total,
+        todo_analytics,
+        achievement_analytics,
+    ]
+
+def habit_analytics(user, range_key):
     today = timezone.now().date()
+    range_label, range_days = ANALYTICS_RANGES[range_key]
     
-    # Get date range (last 30 days)
-    start_date = today - timedelta(days=29)
+    if range_days:
+        start_date = today - timedelta(days=range_days - 1)
+    else:
+        # All time starts at the first day in the daily rollup
+        start_date = DailyUserStats.objects.filter(user=user, date__lte=today).aggregate(
+            first=Min('date')
+        )['first'] or today
     
-    # ===== HABIT ANALYTICS =====
+    # Habit x day completion grid for the range, loaded in one query.
+    # Deleted habits are included so daily and weekly totals count every completion.
+    all_matrix = CompletionMatrix.load(Habit.objects.filter(user=user), start_date, today)
     
     # Get all active habits
-    habits = Habit.objects.filter(user=user, is_active=True)
-    total_habits = habits.count()
-    
-    # Daily completion data for last 30 days
-    daily_completions = []
-    dates_labels = []
+    matrix = all_matrix.active()
+    habits = matrix.habits
+    total_habits = len(habits)
     
-    for i in range(29, -1, -1):
-        date = today - timedelta(days=i)
-        dates_labels.append(date.strftime('%b %d'))
-        
-        completed_count = HabitCompletion.objects.filter(
-            habit__user=user,
-            date=date,
-            completed=True
-        ).count()
-        
-        daily_completions.append(completed_count)
+    # Daily completion data for the range
+    label_format = '%b %d' if matrix.days <= 90 else '%b %d, %Y'
+    dates_labels = [date.strftime(label_format) for date in matrix.dates()]
+    daily_completions = all_matrix.daily_totals()
+    # Days every active habit was completed, the AND of their bitmaps
+    perfect_days = matrix.perfect_day_count()
     
     # Category breakdown
     category_data = {}
@@ -47,46 +85,19 @@ def analytics(request):
         category_data[category] += 1
     
     # Completion rate by category
-    category_completion_rates = {}
-    for habit in habits:
-        category = habit.get_category_display()
-        total_days = 30
-        completed_days = HabitCompletion.objects.filter(
-            habit=habit,
-            date__gte=start_date,
-            date__lte=today,
-            completed=True
-        ).count()
-        
-        if category not in category_completion_rates:
-            category_completion_rates[category] = {'completed': 0, 'total': 0}
-        
-        category_completion_rates[category]['completed'] += completed_days
-        category_completion_rates[category]['total'] += total_days
-    
-    # Calculate percentages
     category_percentages = {}
-    for category, data in category_completion_rates.items():
-        if data['total'] > 0:
-            category_percentages[category] = round((data['completed'] / data['total']) * 100, 1)
+    for category, (completed, total) in matrix.category_totals().items():
+        if total > 0:
+            category_percentages[category] = round((completed / total) * 100, 1)
         else:
             category_percentages[category] = 0
     
     # Best performing habits (highest completion rate)
     best_habits = []
-    for habit in habits:
-        completed = HabitCompletion.objects.filter(
-            habit=habit,
-            date__gte=start_date,
-            date__lte=today,
-            completed=True
-        ).count()
-        
-        rate = (completed / 30) * 100 if completed > 0 else 0
-        
+    for habit, rate in zip(habits, matrix.habit_rates()):
         best_habits.append({
             'name': habit.name,
-            'rate': round(rate, 1),
+            'rate': rate,
             'streak': habit.get_current_streak(),
             'category': habit.get_category_display()
         })
@@ -102,59 +113,26 @@ def analytics(request):
             longest_streak = streak
             longest_streak_habit = habit.name
     
-    # Total completions
-    total_completions = HabitCompletion.objects.filter(
-        habit__user=user,
-        completed=True
-    ).count()
-    
-    # ===== TODO ANALYTICS =====
-    
-    total_todos = Todo.objects.filter(user=user).count()
-    completed_todos = Todo.objects.filter(user=user, completed=True).count()
-    pending_todos = Todo.objects.filter(user=user, completed=False).count()
-    
-    # Completion rate
-    if total_todos > 0:
-        todo_completion_rate = round((completed_todos / total_todos) * 100, 1)
-    else:
-        todo_completion_rate = 0
-    
-    # Priority breakdown
-    priority_breakdown = {
-        'high': Todo.objects.filter(user=user, priority='high').count(),
-        'medium': Todo.objects.filter(user=user, priority='medium').count(),
-        'low': Todo.objects.filter(user=user, priority='low').count(),
-    }
-    
-    # ===== ACHIEVEMENTS =====
-    
-    achievements = Achievement.objects.filter(user=user).order_by('-earned_date')
-    total_achievements = achievements.count()
-    recent_achievements = achievements[:5]
-    
     # Weekly summary (last 7 days)
-    week_start = today - timedelta(days=6)
-    weekly_completions = HabitCompletion.objects.filter(
-        habit__user=user,
-        date__gte=week_start,
-        date__lte=today,
-        completed=True
-    ).count()
+    weekly_completions = sum(daily_completions[-7:])
     
-    weekly_habits_count = habits.count() * 7
+    weekly_habits_count = total_habits * 7
     if weekly_habits_count > 0:
         weekly_completion_rate = round((weekly_completions / weekly_habits_count) * 100, 1)
     else:
         weekly_completion_rate = 0
     
-    context = {
+    return {
         'total_habits': total_habits,
-        'total_completions': total_completions,
         'longest_streak': longest_streak,
         'longest_streak_habit': longest_streak_habit,
-        'total_achievements': total_achievements,
         'weekly_completion_rate': weekly_completion_rate,
+        'perfect_days': perfect_days,
+        
+        # Range selector
+        'range_key': range_key,
+        'range_label': range_label,
+        'analytics_ranges': [(key, label) for key, (label, days) in ANALYTICS_RANGES.items()],
         
         # Chart data (converted to JSON for JavaScript)
         'dates_labels': json.dumps(dates_labels),
@@ -164,14 +142,54 @@ def analytics(request):
         'category_percentages': category_percentages,
         
         'best_habits': best_habits,
-        'recent_achievements': recent_achievements,
-        
-        # Todo stats
+    }
+
+def completion_total(user):
+    # Total completions
+    total_completions = HabitCompletion.objects.filter(
+        habit__user=user,
+        completed=True
+    ).count()
+    
+    return {'total_completions': total_completions}
+
+def todo_analytics(user):
+    todo_counts = Todo.objects.filter(user=user).aggregate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(completed=True)),
+        high=Count('id', filter=Q(priority='high')),
+        medium=Count('id', filter=Q(priority='medium')),
+        low=Count('id', filter=Q(priority='low')),
+    )
+    total_todos = todo_counts['total']
+    completed_todos = todo_counts['completed']
+    pending_todos = total_todos - completed_todos
+    
+    # Completion rate
+    if total_todos > 0:
+        todo_completion_rate = round((completed_todos / total_todos) * 100, 1)
+    else:
+        todo_completion_rate = 0
+    
+    # Priority breakdown
+    priority_breakdown = {
+        'high': todo_counts['high'],
+        'medium': todo_counts['medium'],
+        'low': todo_counts['low'],
+    }
+    
+    return {
         'total_todos': total_todos,
         'completed_todos': completed_todos,
         'pending_todos': pending_todos,
         'todo_completion_rate': todo_completion_rate,
         'priority_breakdown': priority_breakdown,
     }
-    
-    return render(request, 'dashboard/analytics.html', context)
\ No newline at end of file
+
+def achievement_analytics(user):
+    achievements = Achievement.objects.filter(user=user).order_by('-earned_date')
+    return {
+        'total_achievements': achievements.count(),
+        # Evaluated here, the async view renders outside of this thread
+        'recent_achievements': list(achievements[:5]),
+    }
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class DashboardConfig(AppConfig):
     name = "dashboard"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from config.database import configure_sqlite
+        from django.db.backends.signals import connection_created
+        connection_created.connect(configure_sqlite, dispatch_uid='configure_sqlite')
@@ -0,0 +1,94 @@
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections, connections
+from django.shortcuts import render
+from habits.metrics import ANALYTICS_BUILD_LATENCY
+from habits.middleware import current_query_counter
+from .analytics_views import ANALYTICS_RANGES, analytics_parts
+from .middleware import current_profile
+from config.database import read_from_replica
+from .snapshot_cache import aconditional_on_data_version, aget_snapshot
+from .views import DASHBOARD_PARTS
+import asyncio
+import functools
+
+# Shared by all requests of the process, so concurrent fetches never exceed
+# ASYNC_VIEW_THREADS database connections per worker
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_VIEW_THREADS, thread_name_prefix='async-views')
+    return _executor
+
+
+def _run_part(part, user):
+    # Pool threads keep their connection between requests, replace it once too old or broken
+    close_old_connections()
+    try:
+        with ExitStack() as stack:
+            # The middleware only wrapped the request thread's connections, count this thread's queries too
+            for observer in (current_profile.get(), current_query_counter.get()):
+                if observer is None:
+                    continue
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(observer))
+            return part(user)
+    finally:
+        close_old_connections()
+
+
+async def fetch_parts(parts, user):
+    """Build independent context parts concurrently on the pool and merge them"""
+    if settings.ASYNC_VIEW_THREADS:
+        # Django's async ORM runs every query on the request's single sync thread,
+        # so only separate threads with their own connections overlap the queries
+        results = await asyncio.gather(*(
+            sync_to_async(_run_part, thread_sensitive=False, executor=_get_executor())(part, user)
+            for part in parts
+        ))
+    else:
+        results = [await sync_to_async(part)(user) for part in parts]
+
+    context = {}
+    for result in results:
+        context.update(result)
+    return context
+
+
+def alogin_required(view):
+    """login_required for async views"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # request.user is lazy, loading it reads the session
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@alogin_required
+@aconditional_on_data_version
+@read_from_replica
+async def dashboard(request):
+    context = await aget_snapshot('dashboard', request.user, lambda: fetch_parts(DASHBOARD_PARTS, request.user))
+    # Templates, messages and the CSRF token are sync only
+    return await sync_to_async(render)(request, 'dashboard/dashboard.html', context)
+
+
+@alogin_required
+@aconditional_on_data_version
+@read_from_replica
+async def analytics(request):
+    range_key = request.GET.get('range', '30')
+    if range_key not in ANALYTICS_RANGES:
+        range_key = '30'
+
+    with ANALYTICS_BUILD_LATENCY.time():
+        context = await fetch_parts(analytics_parts(range_key), request.user)
+    return await sync_to_async(render)(request, 'dashboard/analytics.html', context)
@@ -0,0 +1,93 @@
+from habits.models import day_index
+from habits.bitmap_service import count_completions, load_bitmaps, perfect_days
+from datetime import date, timedelta
+
+# Turns a string of '0'/'1' characters into 0/1 bytes
+_BIT_CHARS = bytes.maketrans(b'01', b'\x00\x01')
+
+
+class CompletionMatrix:
+    """Dense habit x day grid of completions, one bytearray row per habit"""
+
+    def __init__(self, habits, start_date, end_date):
+        self.habits = list(habits)
+        self.start_date = start_date
+        self.end_date = end_date
+        self.days = (end_date - start_date).days + 1
+        self.rows = [bytearray(self.days) for _ in self.habits]
+        # {habit_id: {year: bits}} the rows were filled from
+        self.bitmaps = {}
+
+    @classmethod
+    def load(cls, habits, start_date, end_date):
+        """Build the matrix from completion bitmaps with a single query"""
+        matrix = cls(habits, start_date, end_date)
+        years = range(start_date.year, end_date.year + 1)
+        bitmaps = matrix.bitmaps = load_bitmaps(matrix.habits, years)
+
+        for habit, row in zip(matrix.habits, matrix.rows):
+            for year, bits in bitmaps[habit.pk].items():
+                matrix._fill_year(row, year, bits)
+
+        return matrix
+
+    def _fill_year(self, row, year, bits):
+        first = max(self.start_date, date(year, 1, 1))
+        last = min(self.end_date, date(year, 12, 31))
+        if first > last:
+            return
+
+        length = (last - first).days + 1
+        segment = (bits >> day_index(first)) & ((1 << length) - 1)
+        # Lowest bit is the first day, so reverse the binary string into day order
+        days = format(segment, f'0{length}b')[::-1].encode().translate(_BIT_CHARS)
+        offset = (first - self.start_date).days
+        row[offset:offset + length] = days
+
+    def active(self):
+        """Matrix of the active habits only, sharing this matrix's rows"""
+        matrix = CompletionMatrix([], self.start_date, self.end_date)
+        matrix.bitmaps = self.bitmaps
+        for habit, row in zip(self.habits, self.rows):
+            if habit.is_active:
+                matrix.habits.append(habit)
+                matrix.rows.append(row)
+        return matrix
+
+    def dates(self):
+        return [self.start_date + timedelta(days=i) for i in range(self.days)]
+
+    def daily_totals(self, last_days=None):
+        """Completions per day across all habits"""
+        start = self.days - last_days if last_days else 0
+        if not self.rows:
+            return [0] * (self.days - start)
+        return [sum(column) for column in zip(*(row[start:] for row in self.rows))]
+
+    def perfect_day_count(self):
+        """Days in the window on which every habit of the matrix was completed"""
+        if not self.habits:
+            return 0
+        years = range(self.start_date.year, self.end_date.year + 1)
+        perfect = {
+            year: perfect_days(self.bitmaps.get(habit.pk, {}).get(year, 0) for habit in self.habits)
+            for year in years
+        }
+        return count_completions(perfect, self.start_date, self.end_date)
+
+    def habit_totals(self):
+        """Completed days per habit, in habit order"""
+        return [row.count(1) for row in self.rows]
+
+    def habit_rates(self):
+        """Completion percentage per habit over the window"""
+        return [round(total / self.days * 100, 1) for total in self.habit_totals()]
+
+    def category_totals(self):
+        """{category: (completed days, habit days)} grouped by category display name"""
+        totals = {}
+        for habit, completed in zip(self.habits, self.habit_totals()):
+            category = habit.get_category_display()
+            done, possible = totals.get(category, (0, 0))
+            totals[category] = (done + completed, possible + self.days)
+        return totals
@@ -0,0 +1,35 @@
+import hmac
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from prometheus_client import CONTENT_TYPE_LATEST
+from habits.metrics import render_metrics
+from .middleware import RECENT_REQUESTS, route_summary
+
+@staff_member_required
+def perf_report(request):
+    # Snapshot the ring buffer, this worker process only
+    recent = list(RECENT_REQUESTS)
+    
+    context = {
+        'enabled': settings.REQUEST_PROFILING,
+        'buffer_size': RECENT_REQUESTS.maxlen,
+        'recent': recent[::-1][:50],
+        'slowest_routes': route_summary()[:10],
+        'most_queries': sorted(recent, key=lambda entry: entry['queries'], reverse=True)[:10],
+    }
+    
+    return render(request, 'dashboard/perf.html', context)
+
+def metrics(request):
+    # Scraped by Prometheus, so no login, only the configured token or addresses
+    if not metrics_allowed(request):
+        raise Http404
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+def metrics_allowed(request):
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return bool(settings.METRICS_TOKEN) and scheme == 'Bearer' and hmac.compare_digest(token, settings.METRICS_TOKEN)
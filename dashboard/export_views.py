@@ -0,0 +1,29 @@
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils import timezone
+from habits.export_service import EXPORT_FORMATS, EXPORT_SECTIONS, export_chunks, gzip_chunks
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+@login_required
+def export_data(request):
+    export_format = request.GET.get('format', 'ndjson')
+    section = request.GET.get('section') or None
+    if export_format not in EXPORT_FORMATS or (section and section not in EXPORT_SECTIONS):
+        return HttpResponseBadRequest('Unknown export format or section')
+    
+    # Rows are streamed as they are read, so memory use does not grow with history
+    chunks = export_chunks(request.user, export_format, section)
+    filename = f"habitflow-{section or 'export'}-{timezone.now().date()}.{export_format}"
+    content_type = CONTENT_TYPES[export_format]
+    if request.GET.get('gzip'):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        content_type = 'application/gzip'
+    
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,137 @@
+from collections import deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+from django.utils import timezone
+import threading
+import time
+
+# Last requests seen by this process, newest last
+RECENT_REQUESTS = deque(maxlen=getattr(settings, 'REQUEST_PROFILING_BUFFER', 200))
+
+# Profile of the request being handled, None outside profiled requests
+current_profile = ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    """Timings collected for one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.template_depth = 0
+        # Async views also run queries on pool threads
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.queries += 1
+                self.db_ms += (time.perf_counter() - start) * 1000
+
+
+def _profiled_render(render):
+    def wrapper(self, context):
+        profile = current_profile.get()
+        if profile is None:
+            return render(self, context)
+
+        # Included and extended templates render inside their parent, only time the outermost
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_ms += (time.perf_counter() - start) * 1000
+
+    wrapper.profiled = True
+    return wrapper
+
+
+class RequestProfilingMiddleware:
+    """Record SQL, template and view time per request as a Server-Timing header and in RECENT_REQUESTS"""
+
+    # Sync only: the execute wrappers must be installed on the thread that runs a sync view
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            # Removed from the middleware chain, so disabled profiling costs nothing
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        if not getattr(Template.render, 'profiled', False):
+            Template.render = _profiled_render(Template.render)
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        size = len(response.content) if not response.streaming else None
+        view_ms = max(total_ms - profile.db_ms - profile.template_ms, 0)
+        match = request.resolver_match
+
+        RECENT_REQUESTS.append({
+            'at': timezone.now(),
+            'method': request.method,
+            'path': request.path,
+            'route': match.view_name if match else request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'view_ms': round(view_ms, 2),
+            'db_ms': round(profile.db_ms, 2),
+            'queries': profile.queries,
+            'template_ms': round(profile.template_ms, 2),
+            'size': size,
+        })
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={profile.db_ms:.2f};desc="{profile.queries} queries"',
+            f'tpl;dur={profile.template_ms:.2f}',
+            f'view;dur={view_ms:.2f}',
+            f'total;dur={total_ms:.2f}',
+        ] + ([f'size;desc="{size} bytes"'] if size is not None else []))
+
+        return response
+
+
+def route_summary():
+    """Per-route aggregates over RECENT_REQUESTS, slowest first"""
+    routes = {}
+    for entry in list(RECENT_REQUESTS):
+        route = routes.setdefault(entry['route'], {
+            'route': entry['route'],
+            'count': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'max_queries': 0,
+        })
+        route['count'] += 1
+        route['total_ms'] += entry['total_ms']
+        route['max_ms'] = max(route['max_ms'], entry['total_ms'])
+        route['max_queries'] = max(route['max_queries'], entry['queries'])
+
+    for route in routes.values():
+        route['avg_ms'] = round(route['total_ms'] / route['count'], 2)
+
+    return sorted(routes.values(), key=lambda route: route['avg_ms'], reverse=True)
@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from habits.models import Achievement, Habit, HabitCompletion
+from habits.signals import user_data_changed
+from todos.models import Todo
+from .snapshot_cache import bump_data_version
+
+
+def invalidate_user(user_id):
+    bump_data_version(user_id)
+    if transaction.get_connection().in_atomic_block:
+        # Bump again once committed, in case another worker cached the pre-commit state meanwhile
+        transaction.on_commit(lambda: bump_data_version(user_id))
+
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+@receiver(post_save, sender=Todo)
+@receiver(post_delete, sender=Todo)
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+def invalidate_on_user_write(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=HabitCompletion)
+@receiver(post_delete, sender=HabitCompletion)
+def invalidate_on_completion_write(sender, instance, **kwargs):
+    # Reuse a habit loaded by the caller, otherwise fetch only its user id
+    if HabitCompletion.habit.is_cached(instance):
+        user_id = instance.habit.user_id
+    else:
+        user_id = Habit.objects.filter(pk=instance.habit_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        invalidate_user(user_id)
+
+
+@receiver(user_data_changed)
+def invalidate_on_bulk_write(sender, user_id, **kwargs):
+    invalidate_user(user_id)
@@ -0,0 +1,158 @@
+from asgiref.sync import sync_to_async
+from config.database import reading_from_replica
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from habits.metrics import SNAPSHOT_CACHE_REQUESTS
+from datetime import datetime, time as time_cls, timezone as dt_timezone
+import functools
+import hashlib
+import time
+
+# How long an unused snapshot is kept, a new data version makes it unreachable sooner
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(user_id):
+    return f'data-version:{user_id}'
+
+
+def get_data_version(user_id):
+    """Current data version for the user, a single cache read"""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Evicted or never written: start a fresh version so no old snapshot can match
+        cache.add(_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def bump_data_version(user_id):
+    """Invalidate every snapshot of the user's data"""
+    # A new timestamp rather than an increment, so concurrent bumps from
+    # different workers can never settle back on an already used version
+    cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def _version_parts(user):
+    return [
+        str(user.pk),
+        # Guards against a reused user id after the database was reset
+        str(user.date_joined.timestamp()),
+        timezone.now().date().isoformat(),
+        str(get_data_version(user.pk)),
+    ]
+
+
+def _snapshot_key(name, user):
+    return ':'.join(['snapshot', name] + _version_parts(user))
+
+
+def _cacheable(user):
+    """Whether a freshly built snapshot may be stored for the current data version"""
+    if not reading_from_replica():
+        return True
+    # The replica may not have the write that created this version yet, and a stale
+    # snapshot stored now would be served until the next write
+    written_ago = (time.time_ns() - get_data_version(user.pk)) / 1e9
+    return written_ago > settings.READ_YOUR_WRITES_SECONDS
+
+
+def get_snapshot(name, user, build):
+    """Return the cached result of build() for the user's current data version, building it on a miss"""
+    key = _snapshot_key(name, user)
+
+    snapshot = cache.get(key)
+    if snapshot is None:
+        SNAPSHOT_CACHE_REQUESTS.labels('miss').inc()
+        snapshot = build()
+        if _cacheable(user):
+            cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    else:
+        SNAPSHOT_CACHE_REQUESTS.labels('hit').inc()
+    return snapshot
+
+
+async def aget_snapshot(name, user, build):
+    """get_snapshot() for async views, build is a coroutine function"""
+    key = await sync_to_async(_snapshot_key)(name, user)
+
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        SNAPSHOT_CACHE_REQUESTS.labels('miss').inc()
+        snapshot = await build()
+        if await sync_to_async(_cacheable)(user):
+            await cache.aset(key, snapshot, SNAPSHOT_TIMEOUT)
+    else:
+        SNAPSHOT_CACHE_REQUESTS.labels('hit').inc()
+    return snapshot
+
+
+def _is_conditional(request):
+    # Queued messages are shown by the next render, so that page must not be a 304
+    return request.user.is_authenticated and not len(messages.get_messages(request))
+
+
+def data_etag(request, *args, **kwargs):
+    """ETag for a page built only from the user's data, None to skip conditional handling"""
+    if not _is_conditional(request):
+        return None
+
+    parts = _version_parts(request.user) + [
+        request.get_full_path(),
+        # Forms embed a token derived from the CSRF cookie
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+
+def data_last_modified(request, *args, **kwargs):
+    """Time of the user's last write, or midnight if later, as the page also depends on the date"""
+    if not _is_conditional(request):
+        return None
+
+    changed = datetime.fromtimestamp(get_data_version(request.user.pk) / 1e9, tz=dt_timezone.utc)
+    midnight = timezone.make_aware(datetime.combine(timezone.now().date(), time_cls.min))
+    return max(changed, midnight)
+
+
+def conditional_on_data_version(view):
+    """Answer unchanged page reloads with 304 before the view builds or renders anything"""
+    view = condition(etag_func=data_etag, last_modified_func=data_last_modified)(view)
+    # Browsers must revalidate on every load instead of guessing freshness from Last-Modified
+    return cache_control(private=True, no_cache=True)(view)
+
+
+def _validators(request):
+    etag = data_etag(request)
+    last_modified = data_last_modified(request)
+    return (
+        quote_etag(etag) if etag is not None else None,
+        int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def aconditional_on_data_version(view):
+    """conditional_on_data_version() for async views, Django's condition decorator only wraps sync ones"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # The validators read the session and the cache, both sync only
+        etag, last_modified = await sync_to_async(_validators)(request)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await view(request, *args, **kwargs)
+
+        if request.method in ('GET', 'HEAD'):
+            if last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified)
+            if etag:
+                response.headers.setdefault('ETag', etag)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
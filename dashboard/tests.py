@@ -1,3 +1,529 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from habits.bitmap_service import rebuild_bitmaps
+from habits.middleware import QueryCounter, current_query_counter
+from habits.models import Achievement, Habit, HabitCompletion, UserPoints
+from habits.seed_service import seed_user
+from todos.models import Todo
+
+from . import async_views
+from .analytics_views import analytics_parts, build_analytics_context
+from .middleware import RECENT_REQUESTS, RequestProfile, current_profile
+from config.database import PRIMARY_COOKIE, read_from_replica
+from config.warmup import compile_templates, warmup
+from .views import DASHBOARD_PARTS, build_dashboard_context
+
+# Tests get a private in-memory cache, so cache.clear() leaves the shared
+# cache directory of a running server alone
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+# Per-view budgets for a heavy user: (method, path, max queries, max milliseconds).
+# Query counts include loading the session and user; tighten them as optimizations land.
+VIEW_BUDGETS = {
+    'dashboard': ('get', '/', 12, 1000),
+    'dashboard_cached': ('get', '/', 2, 250),
+    'analytics': ('get', '/analytics/', 10, 1000),
+    'analytics_all': ('get', '/analytics/?range=all', 9, 1500),
+    'habit_list': ('get', '/habits/', 5, 1000),
+    'todo_list': ('get', '/todos/', 6, 3000),
+    'habit_complete': ('post', '/habits/{habit}/complete/', 25, 500),
+    'todo_toggle': ('post', '/todos/{todo}/toggle/', 4, 250),
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DashboardSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cached', password='secret')
+        self.client.force_login(self.user)
+        self.habit = Habit.objects.create(user=self.user, name='Read')
+
+    def test_cache_hit_only_loads_session_and_user(self):
+        self.client.get('/')
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/')
+        self.assertContains(response, 'Read')
+
+    def test_writes_invalidate_snapshot(self):
+        response = self.client.get('/')
+        self.assertEqual(response.context['habits_completed_today'], 0)
+
+        self.client.post(f'/habits/{self.habit.pk}/complete/')
+        response = self.client.get('/')
+        self.assertEqual(response.context['habits_completed_today'], 1)
+        self.assertEqual(response.context['total_achievements'], 1)
+
+        Todo.objects.create(user=self.user, title='Groceries')
+        response = self.client.get('/')
+        self.assertEqual(response.context['todos_pending_count'], 1)
+
+    def test_snapshots_are_per_user(self):
+        self.client.get('/')
+        other = User.objects.create_user('other', password='secret')
+        self.client.force_login(other)
+
+        response = self.client.get('/')
+        self.assertEqual(response.context['total_habits'], 0)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AnalyticsTotalsTests(TestCase):
+    def test_daily_totals_include_deleted_habits(self):
+        user = User.objects.create_user('totals', password='secret')
+        today = timezone.now().date()
+        read, run = [Habit.objects.create(user=user, name=name) for name in ['Read', 'Run']]
+        for habit in [read, run]:
+            HabitCompletion.objects.create(habit=habit, date=today, completed=True)
+        run.is_active = False
+        run.save()
+
+        context = build_analytics_context(user, '30')
+        # Today's total counts both completions, the per-habit figures only the active habit
+        self.assertEqual(json.loads(context['daily_completions'])[-1], 2)
+        self.assertEqual(context['total_habits'], 1)
+        self.assertEqual([habit['name'] for habit in context['best_habits']], ['Read'])
+        self.assertEqual(context['weekly_completion_rate'], round(2 / 7 * 100, 1))
+
+    def test_perfect_days_need_every_active_habit(self):
+        user = User.objects.create_user('perfect', password='secret')
+        today = timezone.now().date()
+        read, run, dropped = [Habit.objects.create(user=user, name=name) for name in ['Read', 'Run', 'Dropped']]
+        for days_ago in [1, 2, 40]:
+            for habit in [read, run]:
+                HabitCompletion.objects.create(habit=habit, date=today - timedelta(days=days_ago), completed=True)
+        HabitCompletion.objects.create(habit=read, date=today, completed=True)
+        # A deleted habit no longer has to be done
+        dropped.is_active = False
+        dropped.save()
+
+        self.assertEqual(build_analytics_context(user, '30')['perfect_days'], 2)
+        self.assertEqual(build_analytics_context(user, '90')['perfect_days'], 3)
+
+    def test_totals_match_per_day_counts(self):
+        user = User.objects.create_user('counted', password='secret')
+        today = timezone.now().date()
+        rng = random.Random(4)
+        habits = [
+            Habit.objects.create(user=user, name=name, category=category)
+            for name, category in [('Read', 'learning'), ('Run', 'fitness'), ('Lift', 'fitness'), ('Old', 'other')]
+        ]
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(habit=habit, date=today - timedelta(days=days_ago), completed=rng.random() < 0.6)
+            for habit in habits
+            for days_ago in range(120)
+        ])
+        rebuild_bitmaps(habits)
+        Habit.objects.filter(name='Old').update(is_active=False)
+        active = habits[:3]
+
+        context = build_analytics_context(user, '90')
+        dates = [today - timedelta(days=days_ago) for days_ago in range(89, -1, -1)]
+
+        def done(**filters):
+            return HabitCompletion.objects.filter(completed=True, date__gte=dates[0], **filters).count()
+
+        # Daily and weekly totals count every habit, as the per-day queries used to
+        self.assertEqual(
+            json.loads(context['daily_completions']),
+            [HabitCompletion.objects.filter(habit__user=user, date=date, completed=True).count() for date in dates]
+        )
+        self.assertEqual(
+            context['weekly_completion_rate'],
+            round(done(habit__user=user, date__gt=today - timedelta(days=7)) / (len(active) * 7) * 100, 1)
+        )
+        # Rates are over active habits only
+        self.assertEqual(
+            {habit['name']: habit['rate'] for habit in context['best_habits']},
+            {habit.name: round(done(habit=habit) / 90 * 100, 1) for habit in active}
+        )
+        self.assertEqual(context['category_percentages'], {
+            'Learning': round(done(habit=habits[0]) / 90 * 100, 1),
+            'Fitness': round(done(habit__in=habits[1:3]) / 180 * 100, 1),
+        })
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ViewBudgetTests(TestCase):
+    """Fail when a view regresses past its query or time budget, e.g. a reintroduced N+1"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # 50 habits with two years of history and 2,000 todos
+        cls.user = seed_user('heavy', habits=50, days=730, todos=2000)
+        cls.habit = Habit.objects.filter(user=cls.user).first()
+        cls.todo = Todo.objects.filter(user=cls.user, completed=False).first()
+        # Seeded achievements were announced long ago
+        Achievement.objects.filter(user=cls.user).update(notified=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def assertWithinBudget(self, name):
+        method, path, max_queries, max_ms = VIEW_BUDGETS[name]
+        path = path.format(habit=self.habit.pk, todo=self.todo.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(self.client, method)(path)
+            elapsed = (time.perf_counter() - start) * 1000
+
+        self.assertLess(response.status_code, 400)
+        self.assertLessEqual(len(queries), max_queries, f'{name} ran {len(queries)} queries')
+        self.assertLessEqual(elapsed, max_ms, f'{name} took {elapsed:.0f}ms')
+
+    def test_dashboard(self):
+        self.assertWithinBudget('dashboard')
+        self.assertWithinBudget('dashboard_cached')
+
+    def test_analytics(self):
+        self.assertWithinBudget('analytics')
+        self.assertWithinBudget('analytics_all')
+
+    def test_habit_list(self):
+        self.assertWithinBudget('habit_list')
+
+    def test_todo_list(self):
+        self.assertWithinBudget('todo_list')
+
+    def test_habit_complete(self):
+        self.assertWithinBudget('habit_complete')
+
+    def test_todo_toggle(self):
+        self.assertWithinBudget('todo_toggle')
+
+
+@override_settings(REQUEST_PROFILING=True)
+@override_settings(CACHES=TEST_CACHES)
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        RECENT_REQUESTS.clear()
+        self.user = User.objects.create_user('profiled', password='secret')
+        self.client.force_login(self.user)
+
+    def test_server_timing_and_ring_buffer(self):
+        response = self.client.get('/')
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        entry = RECENT_REQUESTS[-1]
+        self.assertEqual(entry['route'], 'dashboard')
+        self.assertGreater(entry['queries'], 0)
+        self.assertGreater(entry['template_ms'], 0)
+        self.assertEqual(entry['size'], len(response.content))
+
+    def test_perf_page_is_staff_only(self):
+        self.assertEqual(self.client.get('/debug/perf/').status_code, 302)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get('/')
+        response = self.client.get('/debug/perf/')
+        self.assertContains(response, 'dashboard')
+
+
+@override_settings(METRICS_TOKEN='scrape-token', METRICS_ALLOWED_IPS=['10.0.0.5'])
+@override_settings(CACHES=TEST_CACHES)
+class MetricsTests(TestCase):
+    def test_metrics_endpoint_reports_views_and_cache(self):
+        user = User.objects.create_user('observed', password='secret')
+        self.client.force_login(user)
+        cache.clear()
+        self.client.get('/')
+        self.client.get('/')
+        self.client.generic('BREW', '/')
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertContains(response, 'habitflow_request_duration_seconds_count{method="GET",view="dashboard"}')
+        self.assertContains(response, 'habitflow_request_duration_seconds_count{method="other",view="dashboard"}')
+        self.assertNotContains(response, 'method="BREW"')
+        self.assertContains(response, 'habitflow_request_queries_bucket')
+        self.assertContains(response, 'habitflow_snapshot_cache_hit_ratio')
+
+    def test_metrics_refuse_anonymous_scrapers(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+        # Logging in does not help either
+        self.client.force_login(User.objects.create_user('curious', password='secret'))
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('refresher', password='secret')
+        self.client.force_login(self.user)
+        self.habit = Habit.objects.create(user=self.user, name='Read')
+        # Like a browser, hold the CSRF cookie set by the first page load
+        self.client.get('/')
+
+    def revalidate(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        return self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_return_304(self):
+        for path in ['/', '/analytics/', '/analytics/?range=all']:
+            self.assertEqual(self.revalidate(path).status_code, 304, path)
+
+    def test_writes_and_messages_skip_304(self):
+        etag = self.client.get('/')['ETag']
+
+        # The redirect after a toggle carries a message, which must be rendered
+        self.client.post(f'/habits/{self.habit.pk}/complete/')
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'completed for today')
+
+        # The data version changed, so the old ETag no longer matches either
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_304_skips_building_the_page(self):
+        etag = self.client.get('/analytics/')['ETag']
+
+        # Session, user and nothing else
+        with self.assertNumQueries(2):
+            response = self.client.get('/analytics/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('concurrent', password='secret')
+        self.habits = [Habit.objects.create(user=self.user, name=name) for name in ['Read', 'Run']]
+        HabitCompletion.objects.create(habit=self.habits[0], date=timezone.now().date(), completed=True)
+        Todo.objects.create(user=self.user, title='Groceries')
+        Achievement.objects.create(user=self.user, achievement_type='first_habit', notified=True)
+
+    def call(self, view, path, user=None, **headers):
+        request = RequestFactory().get(path, **headers)
+        request.user = user or self.user
+        request.session = self.client.session
+        request._messages = FallbackStorage(request)
+        return async_to_sync(view)(request)
+
+    @override_settings(ASYNC_VIEW_THREADS=0)
+    def test_context_matches_sync_views(self):
+        self.assertEqual(
+            async_to_sync(async_views.fetch_parts)(DASHBOARD_PARTS, self.user),
+            build_dashboard_context(self.user)
+        )
+        for range_key in ['30', 'all']:
+            self.assertEqual(
+                async_to_sync(async_views.fetch_parts)(analytics_parts(range_key), self.user),
+                build_analytics_context(self.user, range_key)
+            )
+
+    @override_settings(ASYNC_VIEW_THREADS=0)
+    def test_views_render_and_revalidate(self):
+        for view, path in [(async_views.dashboard, '/'), (async_views.analytics, '/analytics/')]:
+            response = self.call(view, path)
+            self.assertContains(response, 'Run')
+            self.assertIn('no-cache', response['Cache-Control'])
+            self.assertEqual(self.call(view, path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        response = self.call(async_views.dashboard, '/', user=AnonymousUser())
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(ASYNC_VIEW_THREADS=2)
+@override_settings(CACHES=TEST_CACHES)
+class AsyncViewPoolTests(TransactionTestCase):
+    def test_parts_run_on_the_pool(self):
+        user = User.objects.create_user('pooled')
+        Habit.objects.create(user=user, name='Stretch')
+        Todo.objects.create(user=user, title='Call mum', completed=True)
+
+        # Committed data, read through the pool threads' own connections
+        context = async_to_sync(async_views.fetch_parts)(DASHBOARD_PARTS, user)
+        self.assertEqual([habit.name for habit in context['habits']], ['Stretch'])
+        self.assertEqual((context['total_todos'], context['todos_completed_count']), (1, 1))
+        self.assertEqual(context, build_dashboard_context(user))
+
+    def test_pool_queries_reach_the_request_counters(self):
+        user = User.objects.create_user('counted')
+        Habit.objects.create(user=user, name='Stretch')
+        with CaptureQueriesContext(connection) as queries:
+            build_dashboard_context(user)
+
+        profile, counter = RequestProfile(), QueryCounter()
+        profile_token, counter_token = current_profile.set(profile), current_query_counter.set(counter)
+        try:
+            async_to_sync(async_views.fetch_parts)(DASHBOARD_PARTS, user)
+        finally:
+            current_profile.reset(profile_token)
+            current_query_counter.reset(counter_token)
+        self.assertEqual((profile.queries, counter.count), (len(queries), len(queries)))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class WarmupTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def test_warmup_compiles_every_template(self):
+        templates = list((settings.BASE_DIR / 'templates').rglob('*.html'))
+        self.assertEqual(compile_templates(), len(templates))
+        self.assertEqual(set(warmup()), {'templates', 'urls', 'connections'})
+        self.assertEqual(set(warmup(connect=False)), {'templates', 'urls'})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SqliteProfileTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_pragmas_applied_to_new_connections(self):
+        pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], pragmas.get('busy_timeout', 5000))
+            cursor.execute('PRAGMA synchronous')
+            # 1 is NORMAL, 2 the default FULL
+            self.assertEqual(cursor.fetchone()[0], 1 if pragmas else 2)
+
+    def test_decorated_views_read_from_replica(self):
+        def view(request):
+            return router.db_for_read(Habit), router.db_for_write(Habit)
+
+        self.assertEqual(read_from_replica(view)(None), ('default', 'default'))
+        with mock.patch('config.database.replica_configured', return_value=True):
+            self.assertEqual(read_from_replica(view)(None), ('replica', 'default'))
+            async_view = read_from_replica(sync_to_async(view))
+            self.assertEqual(async_to_sync(async_view)(None), ('replica', 'default'))
+        # Undecorated code keeps reading from default
+        self.assertEqual(router.db_for_read(Habit), 'default')
+
+
+@mock.patch('config.database.replica_configured', return_value=True)
+@override_settings(CACHES=TEST_CACHES)
+class ReadYourWritesTests(TransactionTestCase):
+    # The replica alias is a second connection to the test database, standing in for a replica
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('sticky', password='secret')
+        self.habit = Habit.objects.create(user=self.user, name='Read')
+        self.todo = Todo.objects.create(user=self.user, title='Groceries')
+        self.client.force_login(self.user)
+
+    def queries_per_alias(self, method, path):
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica']) as replica:
+                response = getattr(self.client, method)(path)
+        self.assertLess(response.status_code, 400)
+        return len(primary), len(replica), response
+
+    def test_reads_use_the_replica_until_the_user_writes(self, replica_configured):
+        for path in ['/', '/analytics/', '/habits/', '/todos/']:
+            primary, replica, response = self.queries_per_alias('get', path)
+            self.assertGreater(replica, 0, path)
+            self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+        # Writes go to the primary and pin this browser's reads to it
+        primary, replica, response = self.queries_per_alias('post', f'/habits/{self.habit.pk}/complete/')
+        self.assertEqual(replica, 0)
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        self.assertTrue(HabitCompletion.objects.using('replica').filter(habit=self.habit, completed=True).exists())
+
+        for path in ['/', '/analytics/', '/habits/', '/todos/']:
+            primary, replica, response = self.queries_per_alias('get', path)
+            self.assertEqual(replica, 0, path)
+
+        # Once the window has passed the replica is used again
+        self.client.cookies[PRIMARY_COOKIE] = str(time.time() - 1)
+        primary, replica, response = self.queries_per_alias('get', '/todos/')
+        self.assertGreater(replica, 0)
+
+    def test_points_are_settled_and_reread_on_the_primary(self, replica_configured):
+        yesterday = timezone.now().date() - timedelta(days=1)
+        Habit.objects.filter(pk=self.habit.pk).update(streak_points=4, last_completed_date=yesterday - timedelta(days=2))
+        UserPoints.objects.filter(user=self.user).update(total=14, settled_on=yesterday)
+
+        with CaptureQueriesContext(connections['default']) as primary:
+            response = self.client.get('/')
+        self.assertEqual(response.context['user_points'], 10)
+        points_reads = [query['sql'] for query in primary if query['sql'].startswith('SELECT') and 'habits_userpoints' in query['sql']]
+        # The locked read in the settle, then the fresh total
+        self.assertEqual(len(points_reads), 2)
+
+    def test_todo_toggle_pins_reads(self, replica_configured):
+        primary, replica, response = self.queries_per_alias('post', f'/todos/{self.todo.pk}/toggle/')
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]['max-age'], settings.READ_YOUR_WRITES_SECONDS)
+
+        primary, replica, response = self.queries_per_alias('get', '/todos/')
+        self.assertEqual(replica, 0)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_user('exporter', habits=3, days=30, todos=5, password='secret')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def read(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_section(self):
+        body = self.read(self.client.get('/export/?format=csv&section=completions')).decode()
+        lines = body.splitlines()
+
+        self.assertEqual(lines[0], 'habit_id,habit_name,date,completed,notes')
+        self.assertEqual(len(lines) - 1, HabitCompletion.objects.filter(habit__user=self.user).count())
+
+    def test_gzipped_ndjson_covers_every_section(self):
+        response = self.client.get('/export/?format=ndjson&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        records = [json.loads(line) for line in gzip.decompress(self.read(response)).splitlines()]
+
+        counts = {}
+        for record in records:
+            counts[record['type']] = counts.get(record['type'], 0) + 1
+        self.assertEqual(counts['habits'], 3)
+        self.assertEqual(counts['todos'], 5)
+        self.assertEqual(counts['completions'], HabitCompletion.objects.filter(habit__user=self.user).count())
+        self.assertEqual(counts['achievements'], Achievement.objects.filter(user=self.user).count())
+
+    def test_command_matches_view(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'todos.csv')
+            call_command('export_user_data', user='exporter', format='csv', section='todos', output=path, stdout=StringIO())
+            with open(path) as f:
+                exported = f.read()
+
+        body = self.read(self.client.get('/export/?format=csv&section=todos')).decode()
+        self.assertEqual(exported.replace('\r\n', '\n'), body.replace('\r\n', '\n'))
@@ -1,38 +1,37 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from habits.models import Habit, Achievement
-from habits.achievement_service import get_user_points
+from habits.points_service import get_user_points
 from todos.models import Todo
 from django.db.models import Count, Q
+from config.database import read_from_replica
+from .snapshot_cache import conditional_on_data_version, get_snapshot
 
 @login_required
+@conditional_on_data_version
+@read_from_replica
 def dashboard(request):
+    # Served from the per-user snapshot until a habit, completion, todo or achievement changes
+    context = get_snapshot('dashboard', request.user, lambda: build_dashboard_context(request.user))
+    return render(request, 'dashboard/dashboard.html', context)
+
+def build_dashboard_context(user):
+    """Dashboard context with every queryset evaluated, so it can be cached"""
+    context = {}
+    for part in DASHBOARD_PARTS:
+        context.update(part(user))
+    return context
+
+def dashboard_habits(user):
     # Get user's habits
-    all_habits = Habit.objects.filter(user=request.user, is_active=True)
+    all_habits = list(Habit.objects.filter(user=user, is_active=True).with_today())
     
     # Get ONLY uncompleted habits for today
     uncompleted_habits = [habit for habit in all_habits if not habit.is_completed_today()]
     
-    # Get user's todos - ONLY uncompleted
-    todos_pending = Todo.objects.filter(user=request.user, completed=False)[:10]
-    
-    # Get recently completed todos for the sidebar (last 5)
-    todos_completed = Todo.objects.filter(user=request.user, completed=True).order_by('-completed_at')[:5]
-    
-    # Get user's achievements
-    achievements = Achievement.objects.filter(user=request.user).order_by('-earned_date')[:6]
-    total_achievements = Achievement.objects.filter(user=request.user).count()
-    
-    # Calculate user points
-    user_points = get_user_points(request.user)
-    
     # Calculate statistics
-    total_habits = all_habits.count()
-    habits_completed_today = sum(1 for habit in all_habits if habit.is_completed_today())
-    
-    total_todos = Todo.objects.filter(user=request.user).count()
-    todos_pending_count = Todo.objects.filter(user=request.user, completed=False).count()
-    todos_completed_count = Todo.objects.filter(user=request.user, completed=True).count()
+    total_habits = len(all_habits)
+    habits_completed_today = total_habits - len(uncompleted_habits)
     
     # Calculate completion percentage
     if total_habits > 0:
@@ -40,27 +39,50 @@ def dashboard(request):
     else:
         habit_completion_percentage = 0
     
+    return {
+        'habits': uncompleted_habits,  # Only uncompleted habits
+        'all_habits': all_habits,  # For stats
+        'total_habits': total_habits,
+        'habits_completed_today': habits_completed_today,
+        'uncompleted_habits_count': len(uncompleted_habits),
+        'habit_completion_percentage': round(habit_completion_percentage, 1),
+    }
+
+def dashboard_todos(user):
+    # Get user's todos - ONLY uncompleted
+    todos_pending = list(Todo.objects.filter(user=user, completed=False)[:10])
+    
+    # Get recently completed todos for the sidebar (last 5)
+    todos_completed = list(Todo.objects.filter(user=user, completed=True).order_by('-completed_at')[:5])
+    
+    total_todos = Todo.objects.filter(user=user).count()
+    todos_pending_count = Todo.objects.filter(user=user, completed=False).count()
+    todos_completed_count = Todo.objects.filter(user=user, completed=True).count()
+    
     if total_todos > 0:
         todo_completion_percentage = (todos_completed_count / total_todos) * 100
     else:
         todo_completion_percentage = 0
     
-    context = {
-        'habits': uncompleted_habits,  # Only uncompleted habits
-        'all_habits': all_habits,  # For stats
+    return {
         'todos_pending': todos_pending,
         'todos_completed': todos_completed,
-        'achievements': achievements,
-        'total_achievements': total_achievements,
-        'user_points': user_points,
-        'total_habits': total_habits,
-        'habits_completed_today': habits_completed_today,
-        'uncompleted_habits_count': len(uncompleted_habits),
         'total_todos': total_todos,
         'todos_pending_count': todos_pending_count,
         'todos_completed_count': todos_completed_count,
-        'habit_completion_percentage': round(habit_completion_percentage, 1),
         'todo_completion_percentage': round(todo_completion_percentage, 1),
     }
-    
-    return render(request, 'dashboard/dashboard.html', context)
\ No newline at end of file
+
+def dashboard_achievements(user):
+    # Get user's achievements
+    return {
+        'achievements': list(Achievement.objects.filter(user=user).order_by('-earned_date')[:6]),
+        'total_achievements': Achievement.objects.filter(user=user).count(),
+    }
+
+def dashboard_points(user):
+    # Calculate user points
+    return {'user_points': get_user_points(user)}
+
+# Independent parts of the dashboard, the async view fetches them concurrently
+DASHBOARD_PARTS = [dashboard_habits, dashboard_todos, dashboard_achievements, dashboard_points]
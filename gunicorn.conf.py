@@ -0,0 +1,52 @@
+# Gunicorn configuration, picked up automatically from the working directory
+import os
+import shutil
+import tempfile
+import time
+
+# Prometheus multiprocess mode: each worker writes its samples here and /metrics merges them.
+# Set before the app is imported so prometheus_client starts in multiprocess mode.
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'habitflow-prometheus'),
+)
+
+# Import Django and the app once in the master, workers are forked with it loaded
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+# sync: one request per worker process. gthread: GUNICORN_THREADS requests per
+# worker, which suits pages that mostly wait on the database
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.environ.get('GUNICORN_THREADS', '4')) if worker_class == 'gthread' else 1
+
+# Compile templates, build the URL resolver and connect to the database before the first request
+WARMUP = os.environ.get('GUNICORN_WARMUP', 'True') == 'True'
+
+
+def on_starting(server):
+    # Samples left by a previous master would be merged into the new one's
+    multiproc_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def when_ready(server):
+    # With the app preloaded, warm caches once here so every forked worker inherits them
+    if WARMUP and server.cfg.preload_app:
+        from config.warmup import warmup
+        server.log.info('Master warmed up: %s', warmup(connect=False))
+
+
+def post_worker_init(worker):
+    start = time.perf_counter()
+    if WARMUP:
+        from config.warmup import warmup
+        # Only connections are left to do if the master already warmed up
+        warmup()
+    # Read by the startup_bench command
+    worker.log.info('Worker %s ready in %.1f ms', worker.pid, (time.perf_counter() - start) * 1000)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
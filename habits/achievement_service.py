@@ -1,175 +1,141 @@
 from .models import Achievement, Habit, HabitCompletion
+from .job_service import register_task
+from .metrics import ACHIEVEMENT_CHECK_LATENCY, ACHIEVEMENTS_AWARDED
+from .points_service import record_achievement_points
+from .rollup_service import perfect_streak_length
+from .signals import user_data_changed
+from django.core.cache import cache
+from django.db.models import Count, Subquery
 from django.utils import timezone
+from django.utils.functional import cached_property
 from datetime import timedelta
 
-def check_and_award_achievements(user):
-    """Check if user has earned any new achievements"""
-    newly_earned = []
-    
-    # First Habit Achievement
-    if Habit.objects.filter(user=user).count() >= 1:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            achievement_type='first_habit'
-        )
-        if created:
-            newly_earned.append(achievement)
-    
-    # Check all user's habits for streaks
-    user_habits = Habit.objects.filter(user=user, is_active=True)
+# Events that can lead to a new achievement
+COMPLETION_TOGGLED = 'completion_toggled'
+HABIT_CREATED = 'habit_created'
+ALL_EVENTS = {COMPLETION_TOGGLED, HABIT_CREATED}
+
+# Cache flag telling the notification middleware there may be unannounced achievements
+PENDING_KEY = 'achievements-pending:{}'
+
+
+class AchievementRule:
+    """An achievement, the events that can earn it and the check deciding if it is earned"""
     
-    for habit in user_habits:
-        streak = habit.get_current_streak()
-        
-        # Streak achievements
-        if streak >= 3:
-            achievement, created = Achievement.objects.get_or_create(
-                user=user,
-                achievement_type='streak_3'
-            )
-            if created:
-                newly_earned.append(achievement)
-        
-        if streak >= 7:
-            achievement, created = Achievement.objects.get_or_create(
-                user=user,
-                achievement_type='streak_7'
-            )
-            if created:
-                newly_earned.append(achievement)
-        
-        if streak >= 14:
-            achievement, created = Achievement.objects.get_or_create(
-                user=user,
-                achievement_type='streak_14'
-            )
-            if created:
-                newly_earned.append(achievement)
-        
-        if streak >= 30:
-            achievement, created = Achievement.objects.get_or_create(
-                user=user,
-                achievement_type='streak_30'
-            )
-            if created:
-                newly_earned.append(achievement)
-        
-        if streak >= 100:
-            achievement, created = Achievement.objects.get_or_create(
-                user=user,
-                achievement_type='streak_100'
-            )
-            if created:
-                newly_earned.append(achievement)
+    def __init__(self, achievement_type, events, check):
+        self.achievement_type = achievement_type
+        self.events = set(events)
+        self.check = check
+
+
+class AchievementContext:
+    """User stats shared by the rules of one evaluation, each loaded at most once"""
     
-    # Total completions achievements
-    total_completions = HabitCompletion.objects.filter(
-        habit__user=user,
-        completed=True
-    ).count()
+    def __init__(self, user):
+        self.user = user
     
-    if total_completions >= 10:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            achievement_type='complete_10'
-        )
-        if created:
-            newly_earned.append(achievement)
+    @cached_property
+    def habit_count(self):
+        return Habit.objects.filter(user=self.user).count()
     
-    if total_completions >= 50:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            achievement_type='complete_50'
+    @cached_property
+    def best_streak(self):
+        # Stored streak state, so one query covers every habit
+        habits = Habit.objects.filter(user=self.user, is_active=True).only(
+            'current_streak', 'last_completed_date'
         )
-        if created:
-            newly_earned.append(achievement)
+        return max((habit.get_current_streak() for habit in habits), default=0)
     
-    if total_completions >= 100:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            achievement_type='complete_100'
-        )
-        if created:
-            newly_earned.append(achievement)
+    @cached_property
+    def total_completions(self):
+        return HabitCompletion.objects.filter(habit__user=self.user, completed=True).count()
     
-    if total_completions >= 500:
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            achievement_type='complete_500'
-        )
-        if created:
-            newly_earned.append(achievement)
+    @cached_property
+    def perfect_streak(self):
+        # Maintained incrementally on the daily rollup, so this is one row lookup
+        return perfect_streak_length(self.user)
     
-    # Perfect Week - All habits completed for 7 consecutive days
-    if check_perfect_streak(user, days=7):
-        achievement, created = Achievement.objects.get_or_create(
+    def has_perfect_streak(self, days):
+        return self.perfect_streak >= days
+
+
+ACHIEVEMENT_RULES = [
+    AchievementRule('first_habit', [HABIT_CREATED, COMPLETION_TOGGLED], lambda ctx: ctx.habit_count >= 1),
+]
+
+for days, achievement_type in [(3, 'streak_3'), (7, 'streak_7'), (14, 'streak_14'), (30, 'streak_30'), (100, 'streak_100')]:
+    ACHIEVEMENT_RULES.append(AchievementRule(
+        achievement_type,
+        [COMPLETION_TOGGLED],
+        lambda ctx, days=days: ctx.best_streak >= days
+    ))
+
+for count, achievement_type in [(10, 'complete_10'), (50, 'complete_50'), (100, 'complete_100'), (500, 'complete_500')]:
+    ACHIEVEMENT_RULES.append(AchievementRule(
+        achievement_type,
+        [COMPLETION_TOGGLED],
+        lambda ctx, count=count: ctx.total_completions >= count
+    ))
+
+# Perfect Week / Month - All habits completed for 7 / 30 consecutive days.
+# The perfect streak only grows when a completion is toggled.
+ACHIEVEMENT_RULES += [
+    AchievementRule('perfect_week', [COMPLETION_TOGGLED], lambda ctx: ctx.has_perfect_streak(7)),
+    AchievementRule('perfect_month', [COMPLETION_TOGGLED], lambda ctx: ctx.has_perfect_streak(30)),
+]
+
+
+@ACHIEVEMENT_CHECK_LATENCY.time()
+def check_and_award_achievements(user, events=None):
+    """Check if user has earned any new achievements, only evaluating rules the events can affect"""
+    events = ALL_EVENTS if events is None else set(events)
+    
+    earned = set(Achievement.objects.filter(user=user).values_list('achievement_type', flat=True))
+    context = AchievementContext(user)
+    
+    newly_earned = [
+        Achievement(user=user, achievement_type=rule.achievement_type)
+        for rule in ACHIEVEMENT_RULES
+        if rule.achievement_type not in earned and rule.events & events and rule.check(context)
+    ]
+    
+    if newly_earned:
+        Achievement.objects.bulk_create(newly_earned, ignore_conflicts=True)
+        # A concurrent check may have inserted some of them first, keep only the rows written here
+        created = set(Achievement.objects.filter(
             user=user,
-            achievement_type='perfect_week'
-        )
-        if created:
-            newly_earned.append(achievement)
+            earned_date__in=[achievement.earned_date for achievement in newly_earned]
+        ).values_list('achievement_type', flat=True))
+        newly_earned = [achievement for achievement in newly_earned if achievement.achievement_type in created]
     
-    # Perfect Month - All habits completed for 30 consecutive days
-    if check_perfect_streak(user, days=30):
-        achievement, created = Achievement.objects.get_or_create(
-            user=user,
-            achievement_type='perfect_month'
-        )
-        if created:
-            newly_earned.append(achievement)
+    if newly_earned:
+        record_achievement_points(user, newly_earned)
+        cache.set(PENDING_KEY.format(user.pk), True, None)
+        user_data_changed.send(sender=Achievement, user_id=user.pk)
+        for achievement in newly_earned:
+            ACHIEVEMENTS_AWARDED.labels(achievement.achievement_type).inc()
     
     return newly_earned
 
 
-def check_perfect_streak(user, days=7):
-    """Check if user completed all habits for consecutive days"""
-    habits = Habit.objects.filter(user=user, is_active=True)
-    
-    if not habits.exists():
-        return False
-    
-    today = timezone.now().date()
-    
-    for i in range(days):
-        check_date = today - timedelta(days=i)
-        
-        # Check if all habits were completed on this date
-        for habit in habits:
-            completion = HabitCompletion.objects.filter(
-                habit=habit,
-                date=check_date,
-                completed=True
-            ).exists()
-            
-            if not completion:
-                return False
-    
-    return True
+@register_task('achievements')
+def award_achievements_task(user, events):
+    # An empty event set means the job was queued without a specific event
+    check_and_award_achievements(user, events or None)
 
 
-def get_user_points(user):
-    """Calculate total points for user"""
-    points = 0
-    
-    # Points for habits
-    habits_count = Habit.objects.filter(user=user, is_active=True).count()
-    points += habits_count * 10
-    
-    # Points for completions
-    completions = HabitCompletion.objects.filter(
-        habit__user=user,
+def check_perfect_streak(user, days=7):
+    """Check if user completed all habits for consecutive days, in a single grouped query"""
+    today = timezone.now().date()
+    active_habits = Habit.objects.filter(user=user, is_active=True)
+    active_count = active_habits.values('user').annotate(count=Count('id')).values('count')
+    
+    # Days in the window where completions match the number of active habits
+    perfect_days = HabitCompletion.objects.filter(
+        habit__in=active_habits,
+        date__gt=today - timedelta(days=days),
+        date__lte=today,
         completed=True
-    ).count()
-    points += completions * 5
-    
-    # Points for achievements
-    achievements = Achievement.objects.filter(user=user).count()
-    points += achievements * 100
-    
-    # Bonus points for current streaks
-    user_habits = Habit.objects.filter(user=user, is_active=True)
-    for habit in user_habits:
-        streak = habit.get_current_streak()
-        points += streak * 2
+    ).values('date').annotate(done=Count('id')).filter(done=Subquery(active_count)).order_by()
     
-    return points
\ No newline at end of file
+    return perfect_days.count() == days
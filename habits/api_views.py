@@ -0,0 +1,24 @@
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from .sync_service import SyncError, sync
+import json
+
+@require_POST
+def sync_view(request):
+    # JSON clients get a 401 rather than the login page redirect
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'Request body must be a JSON object'}, status=400)
+    
+    try:
+        result = sync(request.user, payload.get('operations', []), payload.get('since'))
+    except SyncError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse(result)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class HabitsConfig(AppConfig):
     name = "habits"
+
+    def ready(self):
+        # Registers signal receivers and deferred job tasks
+        from . import achievement_service, signals  # noqa: F401
@@ -0,0 +1,131 @@
+from .models import CompletionBitmap, HabitCompletion, day_index
+from django.db import transaction
+from datetime import date as date_cls
+
+
+def popcount(bits, start=0, end=365):
+    """Count completed days between two day indexes, both inclusive"""
+    if end < start:
+        return 0
+    window = (bits >> start) & ((1 << (end - start + 1)) - 1)
+    return bin(window).count('1')
+
+
+def run_length(bits, end):
+    """Number of consecutive completed days ending at day index end"""
+    # Highest missed day at or before end stops the run
+    missed = ~bits & ((1 << (end + 1)) - 1)
+    if missed == 0:
+        return end + 1
+    return end - (missed.bit_length() - 1)
+
+
+def perfect_days(bitmaps):
+    """AND bitmaps together, leaving the days every habit was completed"""
+    bitmaps = list(bitmaps)
+    if not bitmaps:
+        return 0
+
+    result = bitmaps[0]
+    for bits in bitmaps[1:]:
+        result &= bits
+    return result
+
+
+def count_completions(bitmaps_by_year, start_date, end_date):
+    """Completed days between two dates using {year: bits} for one habit"""
+    total = 0
+    for year in range(start_date.year, end_date.year + 1):
+        bits = bitmaps_by_year.get(year, 0)
+        start = day_index(start_date) if year == start_date.year else 0
+        end = day_index(end_date) if year == end_date.year else 365
+        total += popcount(bits, start, end)
+    return total
+
+
+def streak_ending(bitmaps_by_year, date):
+    """Consecutive completed days ending on date, following runs into earlier years"""
+    streak = 0
+    while True:
+        bits = bitmaps_by_year.get(date.year, 0)
+        index = day_index(date)
+        run = run_length(bits, index)
+        streak += run
+        if run <= index:
+            return streak
+        # The run reaches January 1st, so continue from December 31st of the year before
+        date = date_cls(date.year - 1, 12, 31)
+
+
+def load_bitmaps(habits, years):
+    """Fetch {habit_id: {year: bits}} for habits in a single query"""
+    result = {habit.pk: {} for habit in habits}
+    bitmaps = CompletionBitmap.objects.filter(habit__in=habits, year__in=years)
+    for bitmap in bitmaps:
+        result[bitmap.habit_id][bitmap.year] = bitmap.as_int()
+    return result
+
+
+def set_completion_bit(habit_id, date, completed):
+    """Mirror a single HabitCompletion write into the habit's bitmap for that year"""
+    with transaction.atomic():
+        bitmaps = CompletionBitmap.objects.select_for_update().filter(habit_id=habit_id, year=date.year)
+        if completed:
+            bitmap, created = bitmaps.get_or_create(habit_id=habit_id, year=date.year)
+        else:
+            # Clearing a bit never needs a new row, which also keeps cascade deletes safe
+            bitmap = bitmaps.first()
+            if bitmap is None:
+                return
+
+        bitmap.set_completed(date, completed)
+        bitmap.save(update_fields=['bits'])
+
+
+def set_completion_bits(habit_ids, date, completed):
+    """Mirror a bulk HabitCompletion write for one date into the habits' bitmaps"""
+    habit_ids = set(habit_ids)
+    with transaction.atomic():
+        bitmaps = list(CompletionBitmap.objects.select_for_update().filter(habit_id__in=habit_ids, year=date.year))
+        for bitmap in bitmaps:
+            bitmap.set_completed(date, completed)
+        CompletionBitmap.objects.bulk_update(bitmaps, ['bits'])
+
+        if completed:
+            missing = habit_ids - {bitmap.habit_id for bitmap in bitmaps}
+            created = [CompletionBitmap(habit_id=habit_id, year=date.year) for habit_id in missing]
+            for bitmap in created:
+                bitmap.set_completed(date, True)
+            CompletionBitmap.objects.bulk_create(created)
+
+
+def rebuild_bitmaps(habits):
+    """Recreate bitmaps for habits from their HabitCompletion rows"""
+    habits = list(habits)
+    bits = {}
+
+    completions = HabitCompletion.objects.filter(
+        habit__in=habits,
+        completed=True
+    ).values_list('habit_id', 'date')
+
+    for habit_id, date in completions.iterator(chunk_size=2000):
+        key = (habit_id, date.year)
+        bits[key] = bits.get(key, 0) | 1 << day_index(date)
+
+    bitmaps = []
+    for (habit_id, year), value in bits.items():
+        bitmap = CompletionBitmap(habit_id=habit_id, year=year)
+        bitmap.set_int(value)
+        bitmaps.append(bitmap)
+
+    with transaction.atomic():
+        CompletionBitmap.objects.filter(habit__in=habits).delete()
+        CompletionBitmap.objects.bulk_create(bitmaps, batch_size=500)
+
+    # Imported here, signals imports this module for its bitmap receivers
+    from .signals import user_data_changed
+    for user_id in {habit.user_id for habit in habits}:
+        user_data_changed.send(sender=CompletionBitmap, user_id=user_id)
+
+    return bitmaps
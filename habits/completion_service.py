@@ -0,0 +1,43 @@
+from .models import Habit, HabitCompletion
+from .bitmap_service import set_completion_bits
+from .points_service import record_bulk_completion_points
+from .rollup_service import record_completion
+from .signals import user_data_changed
+from .streak_service import load_streaks
+from django.db import transaction
+
+
+def set_completions(user, states, date):
+    """Set habits to their {habit id: completed} states for one date in a single transaction, returns habits that changed"""
+    states = {int(habit_id): bool(completed) for habit_id, completed in states.items()}
+    with transaction.atomic():
+        habits = list(Habit.objects.select_for_update().filter(user=user, pk__in=states, is_active=True))
+        current = dict(HabitCompletion.objects.filter(habit__in=habits, date=date).values_list('habit_id', 'completed'))
+        changed = [habit for habit in habits if current.get(habit.pk, False) != states[habit.pk]]
+        if not changed:
+            return []
+
+        # One upsert instead of a get_or_create and save per habit
+        HabitCompletion.objects.bulk_create(
+            [HabitCompletion(habit=habit, date=date, completed=states[habit.pk]) for habit in changed],
+            update_conflicts=True,
+            unique_fields=['habit', 'date'],
+            update_fields=['completed', 'updated_at'],
+        )
+
+        # bulk_create skips the model signals, so update the derived state as a batch
+        completed = [habit for habit in changed if states[habit.pk]]
+        uncompleted = [habit for habit in changed if not states[habit.pk]]
+        for group, state in [(completed, True), (uncompleted, False)]:
+            if group:
+                set_completion_bits([habit.pk for habit in group], date, state)
+
+        # Toggles the stored state can't absorb are rebuilt together, in one streak query
+        stale = [habit for habit in changed if not habit.apply_completion(date, states[habit.pk], save=False, rebuild=False)]
+        load_streaks(stale)
+        Habit.objects.bulk_update(changed, Habit.STREAK_FIELDS)
+        record_completion(user, date, len(completed) - len(uncompleted))
+        record_bulk_completion_points(user, changed, states)
+
+    user_data_changed.send(sender=HabitCompletion, user_id=user.pk)
+    return changed
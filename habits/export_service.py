@@ -0,0 +1,93 @@
+from .models import Achievement, Habit, HabitCompletion
+from django.core.serializers.json import DjangoJSONEncoder
+from todos.models import Todo
+import csv
+import json
+import zlib
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Section -> (queryset for a user, exported columns)
+EXPORT_SECTIONS = {
+    'habits': (
+        lambda user: Habit.objects.filter(user=user).order_by('pk'),
+        ['id', 'name', 'description', 'category', 'created_at', 'is_active'],
+    ),
+    'completions': (
+        lambda user: HabitCompletion.objects.filter(habit__user=user).order_by('habit_id', 'date'),
+        ['habit_id', 'habit__name', 'date', 'completed', 'notes'],
+    ),
+    'todos': (
+        lambda user: Todo.objects.filter(user=user).order_by('pk'),
+        ['id', 'title', 'description', 'priority', 'completed', 'due_date', 'created_at', 'completed_at'],
+    ),
+    'achievements': (
+        lambda user: Achievement.objects.filter(user=user).order_by('earned_date'),
+        ['achievement_type', 'earned_date'],
+    ),
+}
+
+EXPORT_FORMATS = ['csv', 'ndjson']
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes, so rows can be yielded"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(user, section):
+    """Rows of one section as tuples, read from the database in fixed-size chunks"""
+    queryset, columns = EXPORT_SECTIONS[section]
+    return queryset(user).values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def export_csv(user, section):
+    """CSV text for one section, yielded a chunk of rows at a time"""
+    columns = EXPORT_SECTIONS[section][1]
+    writer = csv.writer(_Echo())
+    lines = [writer.writerow([column.replace('__', '_') for column in columns])]
+
+    for row in export_rows(user, section):
+        lines.append(writer.writerow(row))
+        if len(lines) >= EXPORT_CHUNK_SIZE:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def export_ndjson(user, sections=None):
+    """One JSON object per line for every row of the sections, tagged with its section"""
+    for section in sections or EXPORT_SECTIONS:
+        columns = [column.replace('__', '_') for column in EXPORT_SECTIONS[section][1]]
+        lines = []
+        for row in export_rows(user, section):
+            record = dict(zip(columns, row), type=section)
+            lines.append(json.dumps(record, cls=DjangoJSONEncoder) + '\n')
+            if len(lines) >= EXPORT_CHUNK_SIZE:
+                yield ''.join(lines)
+                lines = []
+        if lines:
+            yield ''.join(lines)
+
+
+def export_chunks(user, export_format, section=None):
+    """Encoded export for the format, CSV covers a single section (default completions)"""
+    if export_format == 'csv':
+        chunks = export_csv(user, section or 'completions')
+    else:
+        chunks = export_ndjson(user, [section] if section else None)
+    for chunk in chunks:
+        yield chunk.encode()
+
+
+def gzip_chunks(chunks):
+    """Compress a byte stream on the fly as a gzip file"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,5 +1,6 @@
 from django import forms
 from .models import Habit, HabitCompletion
+from .import_service import IMPORT_FORMATS
 
 class HabitForm(forms.ModelForm):
     class Meta:
@@ -30,4 +31,14 @@ class HabitCompletionForm(forms.ModelForm):
                 'rows': 2,
                 'placeholder': 'Optional: Add notes about today\'s completion'
             }),
-        }
\ No newline at end of file
+        }
+
+class HistoryImportForm(forms.Form):
+    file = forms.FileField(widget=forms.ClearableFileInput(attrs={
+        'class': 'form-control',
+        'accept': '.csv,.ndjson,.jsonl,.json'
+    }))
+    format = forms.ChoiceField(
+        choices=[(choice, choice.upper()) for choice in IMPORT_FORMATS],
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
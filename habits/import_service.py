@@ -0,0 +1,227 @@
+from .models import Habit, HabitCompletion
+from .achievement_service import check_and_award_achievements
+from .bitmap_service import rebuild_bitmaps
+from .points_service import reconcile_points
+from .rollup_service import rebuild_daily_stats
+from .signals import user_data_changed
+from .streak_service import rebuild_streaks
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime, time
+import csv
+import json
+
+IMPORT_BATCH_SIZE = 5000
+IMPORT_FORMATS = ['csv', 'ndjson']
+
+# Only the first few problems are reported, the rest are counted
+MAX_REPORTED_ERRORS = 20
+
+# A listed day counts as completed unless it says otherwise
+TRUE_VALUES = {'', '1', 'true', 'yes', 'y', 't', 'done', 'x'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+
+
+def decode_lines(file, invalid):
+    """Lines of a binary file decoded one at a time, so a bad byte only spoils its own line"""
+    for number, line in enumerate(file, 1):
+        try:
+            yield line.decode('utf-8-sig' if number == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            invalid.append(number)
+            yield line.decode('utf-8', errors='replace')
+
+
+def read_csv(file):
+    """Rows of a CSV upload as dicts, decoded as the file is read"""
+    invalid = []
+    reader = csv.DictReader(decode_lines(file, invalid))
+    # Reading the header first keeps a bad header from being blamed on the first row
+    reader.fieldnames
+    last_line = reader.line_num
+    for row in reader:
+        # A quoted field can span lines, so check every line this row was read from
+        if invalid and invalid[-1] > last_line:
+            yield {'_error': 'invalid UTF-8'}
+        else:
+            yield row
+        last_line = reader.line_num
+
+
+def read_ndjson(file):
+    """Habit and completion records of an NDJSON file, such as our own export"""
+    invalid = []
+    for number, line in enumerate(decode_lines(file, invalid), 1):
+        if invalid and invalid[-1] == number:
+            yield {'_error': 'invalid UTF-8'}
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield {'_error': 'invalid JSON'}
+            continue
+        if not isinstance(record, dict):
+            yield {'_error': 'not a JSON object'}
+        elif record.get('type') in (None, 'habits', 'completions'):
+            yield record
+
+
+def import_history(user, file, import_format='csv', batch_size=IMPORT_BATCH_SIZE):
+    """Import habits and completions from a file, then rebuild derived state once"""
+    rows = read_csv(file) if import_format == 'csv' else read_ndjson(file)
+    importer = HistoryImporter(user, batch_size)
+    try:
+        for row in rows:
+            importer.add(row)
+    finally:
+        # Earlier batches are already committed, so rebuild their derived state even if reading fails
+        summary = importer.finish()
+    return summary
+
+
+class HistoryImporter:
+    """Validates rows and writes them in fixed-size batches, each in its own transaction"""
+
+    def __init__(self, user, batch_size=IMPORT_BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.today = timezone.now().date()
+        self.habits = {habit.name: habit for habit in Habit.objects.filter(user=user, is_active=True)}
+        self.touched = set()
+        self.batch = []
+        self.rows = 0
+        self.error_count = 0
+        self.errors = []
+        self.completions_before = HabitCompletion.objects.filter(habit__user=user).count()
+        self.habits_before = len(self.habits)
+
+    def error(self, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'Row {self.rows}: {message}')
+
+    def add(self, row):
+        self.rows += 1
+        if '_error' in row:
+            self.error(row['_error'])
+            return
+
+        name = row.get('habit') or row.get('habit_name') or row.get('name') or ''
+        if not isinstance(name, str) or not name.strip() or len(name.strip()) > 200:
+            self.error('missing or too long habit name')
+            return
+        name = name.strip()
+        # NDJSON values can be any JSON type, only text is stored
+        for field in ('category', 'description', 'notes'):
+            if row.get(field) is not None and not isinstance(row[field], str):
+                self.error(f'{field} must be text')
+                return
+
+        if row.get('type') == 'habits':
+            # A habit definition from an export, it may have no completions at all
+            self.batch.append((name, None, False, '', row))
+        else:
+            date = parse_import_date(row.get('date'))
+            if date is None:
+                self.error(f'invalid date {row.get("date")!r}')
+                return
+            if date > self.today:
+                self.error(f'date {date.isoformat()} is in the future')
+                return
+            completed = parse_import_bool(row.get('completed', True))
+            if completed is None:
+                self.error(f'invalid completed value {row.get("completed")!r}')
+                return
+            self.batch.append((name, date, completed, row.get('notes') or '', row))
+
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+
+        with transaction.atomic():
+            categories = dict(Habit.CATEGORY_CHOICES)
+            new_habits = {}
+            for name, date, completed, notes, row in self.batch:
+                if name not in self.habits and name not in new_habits:
+                    category = row.get('category')
+                    new_habits[name] = Habit(
+                        user=self.user,
+                        name=name,
+                        description=row.get('description') or '',
+                        category=category if category in categories else 'other',
+                    )
+            for habit in Habit.objects.bulk_create(new_habits.values()):
+                self.habits[habit.name] = habit
+
+            completions = []
+            for name, date, completed, notes, row in self.batch:
+                habit = self.habits[name]
+                self.touched.add(habit.pk)
+                if date is not None:
+                    completions.append(HabitCompletion(habit=habit, date=date, completed=completed, notes=notes))
+
+            # Days already tracked here keep their current state
+            HabitCompletion.objects.bulk_create(completions, ignore_conflicts=True)
+
+        self.batch = []
+
+    def finish(self):
+        self.flush()
+        habits = list(Habit.objects.filter(pk__in=self.touched))
+
+        if habits:
+            # Imported habits existed since their first imported day, so past days can be perfect
+            first_dates = dict(HabitCompletion.objects.filter(habit__in=habits).values('habit').annotate(
+                first=Min('date')
+            ).values_list('habit', 'first'))
+            for habit in habits:
+                first = first_dates.get(habit.pk)
+                if first is not None:
+                    started = timezone.make_aware(datetime.combine(first, time.min))
+                    habit.created_at = min(habit.created_at, started)
+            Habit.objects.bulk_update(habits, ['created_at'])
+
+            # bulk_create skipped signals and incremental updates, so rebuild everything once
+            rebuild_streaks(habits)
+            rebuild_bitmaps(habits)
+            rebuild_daily_stats(self.user)
+            check_and_award_achievements(self.user)
+            reconcile_points(self.user, fix=True)
+            user_data_changed.send(sender=HabitCompletion, user_id=self.user.pk)
+
+        return {
+            'rows': self.rows,
+            'habits_created': len(self.habits) - self.habits_before,
+            'completions_imported': HabitCompletion.objects.filter(habit__user=self.user).count() - self.completions_before,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def parse_import_date(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        # Exports carry plain dates, other trackers often full timestamps
+        return parse_date(value.strip()[:10])
+    except ValueError:
+        return None
+
+
+def parse_import_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    return None
@@ -0,0 +1,81 @@
+from .models import DeferredJob
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Task name -> function(user, events)
+TASKS = {}
+
+# A claimed job is invisible to other workers for JOB_LEASE. A failed one is retried
+# after RETRY_DELAY, doubling with each attempt, and kept but no longer run after MAX_ATTEMPTS.
+JOB_LEASE = timedelta(minutes=5)
+RETRY_DELAY = timedelta(seconds=30)
+MAX_ATTEMPTS = 5
+
+
+def register_task(name):
+    """Register a function the worker can run for a user and a set of events"""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def dispatch(user, task, event=''):
+    """Queue the task when DEFERRED_JOBS is on, otherwise run it straight away"""
+    if getattr(settings, 'DEFERRED_JOBS', False):
+        enqueue(user, task, event)
+    else:
+        TASKS[task](user, {event} if event else set())
+
+
+def enqueue(user, task, event=''):
+    # The unique (user, task, event) row collapses repeated requests into one job.
+    # Queuing it again while it runs refreshes created_at, so the worker keeps it for another run.
+    DeferredJob.objects.bulk_create(
+        [DeferredJob(user=user, task=task, event=event)],
+        update_conflicts=True,
+        unique_fields=['user', 'task', 'event'],
+        update_fields=['created_at', 'attempts', 'run_after']
+    )
+
+
+def process_jobs(batch_size=100):
+    """Claim up to batch_size due jobs and run each task once per user, returns jobs claimed"""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = DeferredJob.objects.filter(run_after__lte=now, attempts__lt=MAX_ATTEMPTS).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+        jobs = list(jobs[:batch_size])
+        # Other workers skip the claimed jobs until the lease runs out
+        DeferredJob.objects.filter(pk__in=[job.pk for job in jobs]).update(run_after=now + JOB_LEASE)
+
+    groups = {}
+    for job in jobs:
+        groups.setdefault((job.user_id, job.task), []).append(job)
+
+    users = User.objects.in_bulk({user_id for user_id, task in groups})
+    for (user_id, task), group in groups.items():
+        if user_id not in users:
+            continue
+        try:
+            TASKS[task](users[user_id], {job.event for job in group if job.event})
+        except Exception:
+            logger.exception('Deferred job %s failed for user %s', task, user_id)
+            for job in group:
+                DeferredJob.objects.filter(pk=job.pk).update(
+                    attempts=F('attempts') + 1,
+                    run_after=timezone.now() + RETRY_DELAY * 2 ** job.attempts
+                )
+        else:
+            # Jobs queued again since the claim run once more
+            DeferredJob.objects.filter(pk__in=[job.pk for job in group], created_at__lte=now).delete()
+
+    return len(jobs)
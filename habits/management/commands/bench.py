@@ -0,0 +1,115 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from dashboard.analytics_views import build_analytics_context
+from habits.achievement_service import check_and_award_achievements, check_perfect_streak
+from habits.models import Habit
+from habits.points_service import get_user_points
+from habits.seed_service import seed_user
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic dataset once timings are taken"""
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of sorted samples"""
+    index = max(int(round(pct / 100 * len(samples))) - 1, 0)
+    return samples[min(index, len(samples) - 1)]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {'runs': 0}
+    return {
+        'runs': len(samples),
+        'min_ms': round(samples[0], 3),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Time the streak, achievement, points and analytics services on a synthetic dataset, as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=3, help='Synthetic users to create')
+        parser.add_argument('--habits', type=int, default=20, help='Habits per user')
+        parser.add_argument('--days', type=int, default=365, help='Days of history per habit')
+        parser.add_argument('--density', type=float, default=0.8, help='Chance a habit was completed on a day')
+        parser.add_argument('--todos', type=int, default=200, help='Todos per user')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed runs per user before measuring')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per user')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the dataset')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            # Everything runs in one transaction that is rolled back, so the database is left untouched
+            with transaction.atomic():
+                report = self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote benchmark results to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def run(self, options):
+        params = {
+            key: options[key]
+            for key in ['users', 'habits', 'days', 'density', 'todos', 'warmup', 'repeat', 'seed']
+        }
+
+        start = time.perf_counter()
+        users = [
+            seed_user(
+                f'bench-{options["seed"]}-{i}',
+                habits=options['habits'],
+                days=options['days'],
+                todos=options['todos'],
+                density=options['density'],
+                seed=options['seed'] + i,
+            )
+            for i in range(options['users'])
+        ]
+        seed_seconds = time.perf_counter() - start
+
+        benchmarks = {
+            'get_current_streak': lambda user, habits: [habit.get_current_streak() for habit in habits],
+            'check_and_award_achievements': lambda user, habits: check_and_award_achievements(user),
+            'check_perfect_streak': lambda user, habits: check_perfect_streak(user, days=7),
+            'get_user_points': lambda user, habits: get_user_points(user),
+            'analytics_context_30': lambda user, habits: build_analytics_context(user, '30'),
+            'analytics_context_all': lambda user, habits: build_analytics_context(user, 'all'),
+        }
+
+        results = {}
+        for name, benchmark in benchmarks.items():
+            samples = []
+            for user in users:
+                habits = list(Habit.objects.filter(user=user, is_active=True))
+                for _ in range(options['warmup']):
+                    benchmark(user, habits)
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    benchmark(user, habits)
+                    samples.append((time.perf_counter() - start) * 1000)
+            results[name] = summarize(samples)
+
+        return {
+            'params': params,
+            'seed_seconds': round(seed_seconds, 3),
+            'results': results,
+        }
@@ -0,0 +1,38 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from habits.export_service import EXPORT_FORMATS, EXPORT_SECTIONS, export_chunks, gzip_chunks
+
+
+class Command(BaseCommand):
+    help = "Stream a user's habits, completions, todos and achievements as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username to export')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--section', choices=list(EXPORT_SECTIONS), help='Only export this section (CSV default: completions)')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--output', help='File to write, stdout if omitted')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"No user named {options['user']}")
+
+        chunks = export_chunks(user, options['format'], options['section'])
+        if options['gzip']:
+            chunks = gzip_chunks(chunks)
+
+        written = 0
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                output.close()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}."))
@@ -0,0 +1,34 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from habits.import_service import IMPORT_BATCH_SIZE, IMPORT_FORMATS, import_history
+
+
+class Command(BaseCommand):
+    help = "Import a user's habit history from CSV or NDJSON, rebuilding derived state once at the end"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, '-' for stdin")
+        parser.add_argument('--user', required=True, help='Username to import into')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, default='csv')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Rows written per transaction')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"No user named {options['user']}")
+
+        source = sys.stdin.buffer if options['path'] == '-' else open(options['path'], 'rb')
+        try:
+            result = import_history(user, source, options['format'], options['batch_size'])
+        finally:
+            if options['path'] != '-':
+                source.close()
+
+        for error in result['errors']:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {result['rows']} rows: {result['completions_imported']} completions imported, "
+            f"{result['habits_created']} habits created, {result['error_count']} rows skipped."
+        ))
@@ -0,0 +1,245 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from habits.models import Habit
+from habits.seed_service import seed_user
+from todos.models import Todo
+from .bench import summarize
+
+LOAD_PASSWORD = 'load-test-password'
+LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1'}
+
+
+def check_scratch_database(allow_seed, allow_database_url=False):
+    """Refuse to migrate and seed benchmark users into a database that may hold real data"""
+    database_url = os.environ.get('DATABASE_URL')
+    if database_url:
+        if not allow_database_url:
+            raise CommandError(
+                'Refusing to seed benchmark users into DATABASE_URL, unset it and set SQLITE_PATH, '
+                'or pass --allow-database-url for a local scratch database'
+            )
+        if urlparse(database_url).hostname not in LOCAL_HOSTS:
+            raise CommandError('--allow-database-url only seeds a DATABASE_URL on localhost')
+        return
+    if not os.environ.get('SQLITE_PATH') and not allow_seed:
+        raise CommandError('Set SQLITE_PATH to a scratch database, or pass --allow-seed to seed the default one')
+
+
+# Relative weight of each action in the replayed mix
+ACTION_WEIGHTS = {
+    'dashboard': 40,
+    'habit-complete': 30,
+    'todo-toggle': 15,
+    'analytics': 15,
+}
+
+
+class VirtualUser(threading.Thread):
+    """Logs in once, then replays the action mix until the deadline"""
+
+    def __init__(self, base_url, username, habit_ids, todo_ids, deadline, seed, record):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.username = username
+        self.habit_ids = habit_ids
+        self.todo_ids = todo_ids
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.record = record
+        self.session = requests.Session()
+
+    def request(self, route, method, path):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(
+                method,
+                self.base_url + path,
+                data={'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', '')} if method == 'POST' else None,
+                allow_redirects=False,
+                timeout=30,
+            )
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.record(route, (time.perf_counter() - start) * 1000, ok)
+        return response
+
+    def login(self):
+        self.session.get(self.base_url + '/login/')
+        response = self.session.post(self.base_url + '/login/', data={
+            'username': self.username,
+            'password': LOAD_PASSWORD,
+            'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', ''),
+        }, allow_redirects=False)
+        return response.status_code == 302
+
+    def write_then_redirect(self, route, path):
+        response = self.request(route, 'POST', path)
+        # The browser follows the redirect back to the dashboard right after every write
+        if response is not None and response.status_code == 302:
+            self.request('dashboard-after-write', 'GET', response.headers['Location'])
+
+    def run(self):
+        if not self.login():
+            self.record('login', 0, False)
+            return
+
+        actions = list(ACTION_WEIGHTS)
+        weights = list(ACTION_WEIGHTS.values())
+        while time.monotonic() < self.deadline:
+            action = self.rng.choices(actions, weights)[0]
+            if action == 'dashboard':
+                self.request('dashboard', 'GET', '/')
+            elif action == 'analytics':
+                self.request('analytics', 'GET', '/analytics/')
+            elif action == 'habit-complete' and self.habit_ids:
+                self.write_then_redirect(action, f'/habits/{self.rng.choice(self.habit_ids)}/complete/')
+            elif action == 'todo-toggle' and self.todo_ids:
+                self.write_then_redirect(action, f'/todos/{self.rng.choice(self.todo_ids)}/toggle/')
+
+
+class Command(BaseCommand):
+    help = 'Replay a dashboard, toggle and analytics mix against a local gunicorn and report latency per route'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Virtual users, each logged in as its own seeded account')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to replay traffic for')
+        parser.add_argument('--workers', type=int, default=2, help='Gunicorn worker processes')
+        parser.add_argument('--port', type=int, default=8765, help='Local port for gunicorn')
+        parser.add_argument('--habits', type=int, default=10, help='Habits per seeded user')
+        parser.add_argument('--days', type=int, default=180, help='Days of history per seeded habit')
+        parser.add_argument('--todos', type=int, default=100, help='Todos per seeded user')
+        parser.add_argument('--reseed', action='store_true', help='Recreate the seeded users even if they exist')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and traffic')
+        parser.add_argument('--output', help='Also write the report as JSON to this file')
+        parser.add_argument('--allow-seed', action='store_true', help='Seed the default SQLite database when SQLITE_PATH is not set')
+        parser.add_argument('--allow-database-url', action='store_true', help='Seed a localhost DATABASE_URL, e.g. a scratch Postgres')
+
+    def handle(self, *args, **options):
+        check_scratch_database(options['allow_seed'], options['allow_database_url'])
+        # Works against a fresh SQLITE_PATH database as well as an existing one
+        call_command('migrate', verbosity=0)
+        users = self.seed(options)
+
+        base_url = f"http://127.0.0.1:{options['port']}"
+        server = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn', 'config.wsgi',
+                '--bind', f"127.0.0.1:{options['port']}",
+                '--workers', str(options['workers']),
+                '--log-level', 'warning',
+            ],
+            cwd=settings.BASE_DIR,
+            env=os.environ.copy(),
+        )
+        try:
+            self.wait_for(base_url, server)
+            report = self.replay(base_url, users, options)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(json.dumps(report, indent=2) + '\n')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {report['requests']} requests at {report['throughput_rps']} req/s."
+        ))
+
+    def seed(self, options):
+        users = []
+        for i in range(options['users']):
+            username = f'load-{i}'
+            user = User.objects.filter(username=username).first()
+            if user and options['reseed']:
+                user.delete()
+                user = None
+            if user is None:
+                user = seed_user(
+                    username,
+                    habits=options['habits'],
+                    days=options['days'],
+                    todos=options['todos'],
+                    seed=options['seed'] + i,
+                    password=LOAD_PASSWORD,
+                )
+            users.append((
+                username,
+                list(Habit.objects.filter(user=user, is_active=True).values_list('pk', flat=True)),
+                list(Todo.objects.filter(user=user).values_list('pk', flat=True)),
+            ))
+        return users
+
+    def wait_for(self, base_url, server, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('gunicorn exited before it was ready')
+            try:
+                requests.get(base_url + '/login/', timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise CommandError(f'gunicorn did not answer on {base_url} within {timeout}s')
+
+    def replay(self, base_url, users, options):
+        samples = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+
+        def record(route, elapsed_ms, ok):
+            with lock:
+                samples[route].append(elapsed_ms)
+                if not ok:
+                    errors[route] += 1
+
+        deadline = time.monotonic() + options['duration']
+        threads = [
+            VirtualUser(base_url, username, habit_ids, todo_ids, deadline, options['seed'] + i, record)
+            for i, (username, habit_ids, todo_ids) in enumerate(users)
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        total = sum(len(route_samples) for route_samples in samples.values())
+        routes = {}
+        for route, route_samples in sorted(samples.items()):
+            routes[route] = summarize(route_samples)
+            routes[route]['errors'] = errors[route]
+            routes[route]['throughput_rps'] = round(len(route_samples) / elapsed, 2)
+
+        return {
+            'users': options['users'],
+            'workers': options['workers'],
+            'duration_seconds': round(elapsed, 2),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 2),
+            'routes': routes,
+        }
+
+    def print_report(self, report):
+        self.stdout.write(f"{'route':<22}{'count':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for route, stats in report['routes'].items():
+            self.stdout.write(
+                f"{route:<22}{stats['runs']:>8}{stats['errors']:>8}{stats['throughput_rps']:>9}"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+            )
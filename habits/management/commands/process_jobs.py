@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from habits.job_service import process_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued achievement and derived-state jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = process_jobs(options['batch_size'])
+            total += processed
+            if processed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} jobs.'))
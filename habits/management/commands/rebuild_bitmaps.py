@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from habits.models import Habit
+from habits.bitmap_service import rebuild_bitmaps
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-year completion bitmaps from HabitCompletion rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild habits belonging to this username')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        habits = Habit.objects.order_by('pk')
+        if options['user']:
+            habits = habits.filter(user__username=options['user'])
+
+        batch_size = options['batch_size']
+        habit_count = 0
+        bitmap_count = 0
+        last_pk = 0
+
+        while True:
+            batch = list(habits.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            bitmap_count += len(rebuild_bitmaps(batch))
+            habit_count += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {bitmap_count} bitmaps for {habit_count} habits.'
+        ))
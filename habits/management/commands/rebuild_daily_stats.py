@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from habits.rollup_service import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Backfill or rebuild the per-user daily stats rollup from HabitCompletion rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild this username')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+
+        user_count = 0
+        row_count = 0
+        for user in users.iterator():
+            row_count += len(rebuild_daily_stats(user))
+            user_count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {row_count} daily stats rows for {user_count} users.'
+        ))
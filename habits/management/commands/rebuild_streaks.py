@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from habits.models import Habit
+from habits.streak_service import rebuild_streaks
+
+
+class Command(BaseCommand):
+    help = 'Rebuild stored habit streak state from HabitCompletion rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild habits belonging to this username')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        habits = Habit.objects.order_by('pk')
+        if options['user']:
+            habits = habits.filter(user__username=options['user'])
+
+        batch_size = options['batch_size']
+        checked = 0
+        drifted = 0
+        last_pk = 0
+
+        while True:
+            batch = list(habits.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            drifted += len(rebuild_streaks(batch))
+            checked += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} habits, repaired {drifted} with drifted streak state.'
+        ))
@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from habits.points_service import reconcile_points
+
+
+class Command(BaseCommand):
+    help = 'Verify the points ledger and running totals against habits, completions and achievements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only check this username')
+        parser.add_argument('--fix', action='store_true', help='Post adjustment entries for mismatches')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+
+        checked = 0
+        mismatched = 0
+        for user in users.iterator():
+            result = reconcile_points(user, fix=options['fix'])
+            checked += 1
+            if result['ledger'] != result['expected'] or result['total'] != result['expected']:
+                mismatched += 1
+                self.stdout.write(
+                    f"{user.username}: expected {result['expected']}, "
+                    f"ledger {result['ledger']}, running total {result['total']}"
+                )
+
+        action = 'fixed' if options['fix'] else 'found'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} users, {action} {mismatched} mismatches.'
+        ))
@@ -0,0 +1,170 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.utils import timezone
+from config.database import read_from_replica
+from dashboard.analytics_views import build_analytics_context
+from dashboard.views import build_dashboard_context
+from habits.completion_service import set_completions
+from habits.models import Habit
+from habits.seed_service import seed_user
+from .bench import summarize
+from .loadtest import check_scratch_database
+
+# SQLITE_PERFORMANCE values compared by --compare
+PROFILES = {'default': 'False', 'performance': 'True'}
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent analytics readers and habit completion writers against SQLite and report latency and lock errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Threads building analytics and dashboard contexts')
+        parser.add_argument('--writers', type=int, default=4, help='Threads toggling habit completions')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to run for')
+        parser.add_argument('--habits', type=int, default=20, help='Habits of the seeded user')
+        parser.add_argument('--days', type=int, default=365, help='Days of history per seeded habit')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and traffic')
+        parser.add_argument('--compare', action='store_true', help='Run with and without the SQLite performance profile on scratch databases')
+        parser.add_argument('--output', help='Also write the report as JSON to this file')
+        parser.add_argument('--allow-seed', action='store_true', help='Seed the default SQLite database when SQLITE_PATH is not set')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            report = {profile: self.run_profile(profile, options) for profile in PROFILES}
+            for profile, profile_report in report.items():
+                self.stdout.write(f'{profile} profile')
+                self.print_report(profile_report)
+        else:
+            if connection.vendor != 'sqlite':
+                raise CommandError('sqlite_stress needs the SQLite database, unset DATABASE_URL')
+            check_scratch_database(options['allow_seed'])
+            report = self.stress(options)
+            self.print_report(report)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(json.dumps(report, indent=2) + '\n')
+
+        self.stdout.write(self.style.SUCCESS('Stress run finished.'))
+
+    def run_profile(self, profile, options):
+        """Run this command in a subprocess on a fresh database with the profile's settings"""
+        directory = tempfile.mkdtemp(prefix=f'sqlite-stress-{profile}-')
+        output = os.path.join(directory, 'report.json')
+        env = dict(
+            os.environ,
+            SQLITE_PATH=os.path.join(directory, 'db.sqlite3'),
+            SQLITE_PERFORMANCE=PROFILES[profile],
+            CACHE_DIR=os.path.join(directory, 'cache'),
+        )
+        env.pop('DATABASE_URL', None)
+
+        arguments = ['readers', 'writers', 'duration', 'habits', 'days', 'seed']
+        command = [sys.executable, 'manage.py', 'sqlite_stress', '--output', output]
+        for argument in arguments:
+            command += [f"--{argument}", str(options[argument])]
+        subprocess.run(command, cwd=settings.BASE_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+        with open(output) as f:
+            return json.load(f)
+
+    def stress(self, options):
+        call_command('migrate', verbosity=0)
+        user = User.objects.filter(username='sqlite-stress').first()
+        if user is None:
+            user = seed_user('sqlite-stress', habits=options['habits'], days=options['days'], todos=200, seed=options['seed'])
+        habit_ids = list(Habit.objects.filter(user=user, is_active=True).values_list('pk', flat=True))
+        # Worker threads open their own connections
+        connections.close_all()
+
+        samples = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+
+        def record(route, start, error=None):
+            with lock:
+                samples[route].append((time.perf_counter() - start) * 1000)
+                if error:
+                    errors[route] += 1
+
+        @read_from_replica
+        def read(rng):
+            # The views' routing without the HTTP layer
+            if rng.random() < 0.5:
+                return 'analytics', build_analytics_context(user, rng.choice(['30', '90']))
+            return 'dashboard', build_dashboard_context(user)
+
+        def reader(seed):
+            rng = random.Random(seed)
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    route, context = read(rng)
+                    record(route, start)
+                except OperationalError:
+                    record('read', start, error=True)
+            connections.close_all()
+
+        def writer(seed):
+            rng = random.Random(seed)
+            today = timezone.now().date()
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    set_completions(user, {rng.choice(habit_ids): rng.random() < 0.5}, today)
+                    record('habit-complete', start)
+                except OperationalError:
+                    # "database is locked" once the busy timeout ran out
+                    record('habit-complete', start, error=True)
+            connections.close_all()
+
+        threads = [threading.Thread(target=reader, args=(options['seed'] + i,)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(options['seed'] + 1000 + i,)) for i in range(options['writers'])]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+
+        routes = {}
+        for route, route_samples in sorted(samples.items()):
+            routes[route] = summarize(route_samples)
+            routes[route]['errors'] = errors[route]
+            routes[route]['throughput_rps'] = round(len(route_samples) / elapsed, 2)
+
+        return {
+            'journal_mode': journal_mode,
+            'replica': 'replica' in settings.DATABASES,
+            'readers': options['readers'],
+            'writers': options['writers'],
+            'duration_seconds': round(elapsed, 2),
+            'routes': routes,
+        }
+
+    def print_report(self, report):
+        self.stdout.write(f"journal_mode={report['journal_mode']} read-only alias={report['replica']}")
+        self.stdout.write(f"{'route':<18}{'count':>8}{'errors':>8}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for route, stats in report['routes'].items():
+            self.stdout.write(
+                f"{route:<18}{stats['runs']:>8}{stats['errors']:>8}{stats['throughput_rps']:>9}"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+            )
@@ -0,0 +1,167 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from habits.seed_service import seed_user
+from .bench import summarize
+from .loadtest import LOAD_PASSWORD, check_scratch_database
+
+# Profile -> gunicorn.conf.py environment, baseline is how the Procfile used to run
+PROFILES = {
+    'baseline': {'GUNICORN_PRELOAD': 'False', 'GUNICORN_WARMUP': 'False'},
+    'warmup': {'GUNICORN_PRELOAD': 'False', 'GUNICORN_WARMUP': 'True'},
+    'preload-warmup': {'GUNICORN_PRELOAD': 'True', 'GUNICORN_WARMUP': 'True'},
+}
+
+READY_LINE = re.compile(r'Worker (\d+) ready')
+
+# First requests after boot, in the order a browser makes them
+ROUTES = [
+    ('login', '/login/'),
+    ('dashboard', '/'),
+    ('analytics', '/analytics/'),
+    ('habit-list', '/habits/'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Boot gunicorn under each server profile and report cold-start time and first-request latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+        parser.add_argument('--worker-class', choices=['sync', 'gthread'], default='sync')
+        parser.add_argument('--workers', type=int, default=1, help='Gunicorn worker processes')
+        parser.add_argument('--port', type=int, default=8766, help='Local port for gunicorn')
+        parser.add_argument('--repeat', type=int, default=10, help='Warm requests per route after the first')
+        parser.add_argument('--output', help='Also write the report as JSON to this file')
+        parser.add_argument('--allow-seed', action='store_true', help='Seed the default SQLite database when SQLITE_PATH is not set')
+        parser.add_argument('--allow-database-url', action='store_true', help='Seed a localhost DATABASE_URL, e.g. a scratch Postgres')
+
+    def handle(self, *args, **options):
+        check_scratch_database(options['allow_seed'], options['allow_database_url'])
+        call_command('migrate', verbosity=0)
+        if not User.objects.filter(username='startup-bench').exists():
+            seed_user('startup-bench', habits=10, days=180, todos=100, password=LOAD_PASSWORD)
+
+        report = {
+            'worker_class': options['worker_class'],
+            'workers': options['workers'],
+            'profiles': {profile: self.run_profile(profile, options) for profile in options['profiles']},
+        }
+
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(json.dumps(report, indent=2) + '\n')
+
+        self.stdout.write(self.style.SUCCESS(f"Measured {len(report['profiles'])} profiles."))
+
+    def run_profile(self, profile, options):
+        base_url = f"http://127.0.0.1:{options['port']}"
+        # A fresh cache per run, otherwise later profiles get earlier snapshots
+        cache_dir = tempfile.mkdtemp(prefix='startup-bench-cache-')
+        env = dict(
+            os.environ,
+            GUNICORN_WORKER_CLASS=options['worker_class'],
+            CACHE_DIR=cache_dir,
+            **PROFILES[profile]
+        )
+
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn', 'config.wsgi',
+                '--bind', f"127.0.0.1:{options['port']}",
+                '--workers', str(options['workers']),
+                '--log-level', 'info',
+            ],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            cold_start_ms = self.wait_for_workers(server, options['workers'], start)
+            first, warm = self.time_requests(base_url, options['repeat'])
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+        return {
+            'cold_start_ms': round(cold_start_ms, 1),
+            'first_request_ms': first,
+            'warm': warm,
+        }
+
+    def wait_for_workers(self, server, workers, start, timeout=60):
+        """Milliseconds from spawning gunicorn until every worker logged that it is ready"""
+        ready = []
+        done = threading.Event()
+
+        def read():
+            for line in server.stderr:
+                if READY_LINE.search(line):
+                    ready.append(time.perf_counter())
+                    if len(ready) >= workers:
+                        done.set()
+            done.set()
+
+        threading.Thread(target=read, daemon=True).start()
+        if not done.wait(timeout) or len(ready) < workers:
+            raise CommandError('gunicorn workers did not become ready, see its log above')
+        return (ready[-1] - start) * 1000
+
+    def time_requests(self, base_url, repeat):
+        session = requests.Session()
+        first = {}
+        samples = {route: [] for route, path in ROUTES}
+
+        for i in range(repeat + 1):
+            for route, path in ROUTES:
+                request_start = time.perf_counter()
+                response = session.get(base_url + path, allow_redirects=False, timeout=30)
+                elapsed = (time.perf_counter() - request_start) * 1000
+                if response.status_code >= 400:
+                    raise CommandError(f'{path} answered {response.status_code}')
+                if i == 0:
+                    first[route] = round(elapsed, 1)
+                else:
+                    samples[route].append(elapsed)
+
+                if route == 'login' and i == 0:
+                    # The login page is the only first request made anonymously
+                    session.post(base_url + path, data={
+                        'username': 'startup-bench',
+                        'password': LOAD_PASSWORD,
+                        'csrfmiddlewaretoken': session.cookies.get('csrftoken', ''),
+                    }, allow_redirects=False, timeout=30)
+
+        return first, {route: summarize(route_samples) for route, route_samples in samples.items()}
+
+    def print_report(self, report):
+        header = f"{'profile':<16}{'cold start':>12}" + ''.join(f'{route:>14}' for route, path in ROUTES)
+        self.stdout.write(f"First request ms ({report['worker_class']}, {report['workers']} workers)")
+        self.stdout.write(header)
+        for profile, stats in report['profiles'].items():
+            self.stdout.write(
+                f"{profile:<16}{stats['cold_start_ms']:>12}"
+                + ''.join(f"{stats['first_request_ms'][route]:>14}" for route, path in ROUTES)
+            )
+        self.stdout.write('Warm p50 ms')
+        for profile, stats in report['profiles'].items():
+            self.stdout.write(
+                f"{profile:<16}{'':>12}"
+                + ''.join(f"{stats['warm'][route]['p50_ms']:>14}" for route, path in ROUTES)
+            )
@@ -0,0 +1,77 @@
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+import os
+
+# Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR,
+# see gunicorn.conf.py, and /metrics merges them at scrape time
+
+REQUEST_LATENCY = Histogram(
+    'habitflow_request_duration_seconds',
+    'Request latency by URL name',
+    ['view', 'method'],
+)
+
+REQUEST_QUERIES = Histogram(
+    'habitflow_request_queries',
+    'Database queries per request by URL name',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500),
+)
+
+ACHIEVEMENT_CHECK_LATENCY = Histogram(
+    'habitflow_achievement_check_duration_seconds',
+    'Duration of check_and_award_achievements',
+)
+
+ANALYTICS_BUILD_LATENCY = Histogram(
+    'habitflow_analytics_build_duration_seconds',
+    'Duration of building the analytics context',
+)
+
+ACHIEVEMENTS_AWARDED = Counter(
+    'habitflow_achievements_awarded',
+    'Achievements awarded by type',
+    ['achievement_type'],
+)
+
+SNAPSHOT_CACHE_REQUESTS = Counter(
+    'habitflow_snapshot_cache_requests',
+    'Dashboard snapshot lookups by result',
+    ['result'],
+)
+
+
+class CacheHitRatioCollector:
+    """Snapshot cache hit ratio, derived from the merged request counters at scrape time"""
+
+    def __init__(self, source):
+        self.source = source
+
+    def collect(self):
+        counts = {'hit': 0.0, 'miss': 0.0}
+        for metric in self.source.collect():
+            if metric.name != 'habitflow_snapshot_cache_requests':
+                continue
+            for sample in metric.samples:
+                if sample.name.endswith('_total'):
+                    counts[sample.labels['result']] = counts.get(sample.labels['result'], 0.0) + sample.value
+
+        lookups = counts['hit'] + counts['miss']
+        yield GaugeMetricFamily(
+            'habitflow_snapshot_cache_hit_ratio',
+            'Share of dashboard snapshot lookups served from the cache',
+            value=counts['hit'] / lookups if lookups else 0.0,
+        )
+
+
+def render_metrics():
+    """Exposition text for every worker process, or this process outside gunicorn"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        source = multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = CollectorRegistry()
+        source = REGISTRY
+        registry.register(source)
+    registry.register(CacheHitRatioCollector(source))
+    return generate_latest(registry)
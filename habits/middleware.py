@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from contextlib import ExitStack
+from contextvars import ContextVar
+from .achievement_service import PENDING_KEY
+from .metrics import REQUEST_LATENCY, REQUEST_QUERIES
+from .models import Achievement
+import threading
+import time
+
+
+class AchievementNotificationMiddleware:
+    """Announce achievements earned since the last page load through the messages framework"""
+
+    # Sync only, it queries through the ORM and the lazy request.user
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method == 'GET' and request.user.is_authenticated and self.may_have_pending(request.user):
+            pending = list(Achievement.objects.filter(user=request.user, notified=False))
+            if pending:
+                for achievement in pending:
+                    messages.success(
+                        request,
+                        f'🏆 Achievement Unlocked: {achievement.get_achievement_type_display()}!'
+                    )
+                Achievement.objects.filter(pk__in=[achievement.pk for achievement in pending]).update(notified=True)
+            cache.set(PENDING_KEY.format(request.user.pk), False, None)
+
+        return self.get_response(request)
+
+    def may_have_pending(self, user):
+        # A missing flag (evicted or never set) falls back to asking the database
+        return cache.get(PENDING_KEY.format(user.pk), True)
+
+
+
+# Methods reported as themselves, anything else is labelled 'other'
+METRIC_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+# Query counter of the request being measured, for queries run on other threads
+current_query_counter = ContextVar('current_query_counter', default=None)
+
+
+class QueryCounter:
+    """connection.execute_wrapper hook counting queries, from any thread of the request"""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class RequestMetricsMiddleware:
+    """Observe latency and query count per URL name for the /metrics endpoint"""
+
+    # Sync only, like RequestProfilingMiddleware it wraps the view thread's connections
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        if not settings.PROMETHEUS_METRICS:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        token = current_query_counter.set(counter)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(counter))
+                response = self.get_response(request)
+        finally:
+            current_query_counter.reset(token)
+
+        # URL names keep label cardinality bounded, unlike raw paths
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        method = request.method if request.method in METRIC_METHODS else 'other'
+        REQUEST_LATENCY.labels(view, method).observe(time.perf_counter() - start)
+        REQUEST_QUERIES.labels(view).observe(counter.count)
+
+        return response
@@ -0,0 +1,74 @@
+# Generated by Django 4.2 on 2026-10-18 18:42
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_streak_state(apps, schema_editor):
+    Habit = apps.get_model("habits", "Habit")
+    HabitCompletion = apps.get_model("habits", "HabitCompletion")
+
+    dates_by_habit = {}
+    completions = (
+        HabitCompletion.objects.filter(completed=True)
+        .order_by("habit_id", "date")
+        .values_list("habit_id", "date")
+    )
+    for habit_id, date in completions:
+        dates_by_habit.setdefault(habit_id, []).append(date)
+
+    habits = []
+    for habit in Habit.objects.filter(pk__in=dates_by_habit):
+        current = longest = 0
+        start = last = None
+        for date in dates_by_habit[habit.pk]:
+            if last is not None and date == last + timedelta(days=1):
+                current += 1
+            else:
+                current = 1
+                start = date
+            last = date
+            longest = max(longest, current)
+        habit.current_streak = current
+        habit.longest_streak = longest
+        habit.streak_start_date = start
+        habit.last_completed_date = last
+        habits.append(habit)
+
+    Habit.objects.bulk_update(
+        habits,
+        ["current_streak", "longest_streak", "streak_start_date", "last_completed_date"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0002_achievement"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="habit",
+            name="current_streak",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="habit",
+            name="last_completed_date",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="habit",
+            name="longest_streak",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="habit",
+            name="streak_start_date",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_streak_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2 on 2026-10-18 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_bitmaps(apps, schema_editor):
+    HabitCompletion = apps.get_model("habits", "HabitCompletion")
+    CompletionBitmap = apps.get_model("habits", "CompletionBitmap")
+
+    bits = {}
+    completions = HabitCompletion.objects.filter(completed=True).values_list(
+        "habit_id", "date"
+    )
+    for habit_id, date in completions.iterator(chunk_size=2000):
+        key = (habit_id, date.year)
+        bits[key] = bits.get(key, 0) | 1 << (date.timetuple().tm_yday - 1)
+
+    CompletionBitmap.objects.bulk_create(
+        [
+            CompletionBitmap(habit_id=habit_id, year=year, bits=value.to_bytes(46, "little"))
+            for (habit_id, year), value in bits.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0003_habit_streak_state"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompletionBitmap",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.PositiveSmallIntegerField()),
+                ("bits", models.BinaryField(default=bytes(46))),
+                (
+                    "habit",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="habits.habit"
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-year"],
+                "unique_together": {("habit", "year")},
+            },
+        ),
+        migrations.RunPython(backfill_bitmaps, migrations.RunPython.noop),
+    ]
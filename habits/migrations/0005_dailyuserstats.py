@@ -0,0 +1,87 @@
+# Generated by Django 4.2 on 2026-10-18 18:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def backfill_daily_stats(apps, schema_editor):
+    Habit = apps.get_model("habits", "Habit")
+    HabitCompletion = apps.get_model("habits", "HabitCompletion")
+    DailyUserStats = apps.get_model("habits", "DailyUserStats")
+
+    created_dates = {}
+    for user_id, created_at in Habit.objects.filter(is_active=True).values_list(
+        "user_id", "created_at"
+    ):
+        created_dates.setdefault(user_id, []).append(
+            timezone.localtime(created_at).date()
+        )
+
+    rows = []
+    counts = (
+        HabitCompletion.objects.filter(completed=True)
+        .values("habit__user_id", "date")
+        .annotate(completions=Count("id"))
+        .order_by()
+    )
+    for row in counts.iterator(chunk_size=2000):
+        user_id = row["habit__user_id"]
+        active = sum(
+            1 for created in created_dates.get(user_id, []) if created <= row["date"]
+        )
+        rows.append(
+            DailyUserStats(
+                user_id=user_id,
+                date=row["date"],
+                completions=row["completions"],
+                active_habits=active,
+                perfect_day=active > 0 and row["completions"] >= active,
+            )
+        )
+
+    DailyUserStats.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("habits", "0004_completionbitmap"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyUserStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("completions", models.PositiveIntegerField(default=0)),
+                ("active_habits", models.PositiveIntegerField(default=0)),
+                ("perfect_day", models.BooleanField(default=False)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "daily user stats",
+                "ordering": ["-date"],
+                "unique_together": {("user", "date")},
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2 on 2026-10-18 18:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("habits", "0005_dailyuserstats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeferredJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("task", models.CharField(max_length=50)),
+                ("event", models.CharField(blank=True, max_length=50)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+        # Achievements earned before this migration were already announced
+        migrations.AddField(
+            model_name="achievement",
+            name="notified",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name="achievement",
+            name="notified",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name="achievement",
+            index=models.Index(
+                fields=["user", "notified"], name="habits_achi_user_id_f46f1a_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="deferredjob",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="deferredjob",
+            unique_together={("user", "task", "event")},
+        ),
+    ]
@@ -0,0 +1,142 @@
+# Generated by Django 4.2 on 2026-10-18 18:49
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def open_points_ledger(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    Habit = apps.get_model("habits", "Habit")
+    HabitCompletion = apps.get_model("habits", "HabitCompletion")
+    Achievement = apps.get_model("habits", "Achievement")
+    PointsEntry = apps.get_model("habits", "PointsEntry")
+    UserPoints = apps.get_model("habits", "UserPoints")
+
+    today = timezone.now().date()
+    yesterday = today - timedelta(days=1)
+
+    # Streak bonus as get_user_points() calculated it: 2 points per current streak day
+    habits = []
+    streak_points = {}
+    for habit in Habit.objects.filter(
+        is_active=True, last_completed_date__gte=yesterday
+    ):
+        habit.streak_points = habit.current_streak * 2
+        streak_points[habit.user_id] = (
+            streak_points.get(habit.user_id, 0) + habit.streak_points
+        )
+        habits.append(habit)
+    Habit.objects.bulk_update(habits, ["streak_points"], batch_size=500)
+
+    totals = dict(streak_points)
+    grouped = [
+        (Habit.objects.filter(is_active=True), "user_id", 10),
+        (HabitCompletion.objects.filter(completed=True), "habit__user_id", 5),
+        (Achievement.objects.all(), "user_id", 100),
+    ]
+    for queryset, user_field, points in grouped:
+        counts = queryset.values(user_field).annotate(count=Count("id")).order_by()
+        for row in counts:
+            user_id = row[user_field]
+            totals[user_id] = totals.get(user_id, 0) + row["count"] * points
+
+    entries = [
+        PointsEntry(user_id=user_id, reason="adjustment", points=total)
+        for user_id, total in totals.items()
+        if total
+    ]
+    balances = [
+        UserPoints(user_id=user_id, total=totals.get(user_id, 0), settled_on=today)
+        for user_id in User.objects.values_list("pk", flat=True)
+    ]
+
+    PointsEntry.objects.bulk_create(entries, batch_size=500)
+    UserPoints.objects.bulk_create(balances, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("habits", "0006_deferred_jobs"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserPoints",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("total", models.IntegerField(default=0)),
+                ("settled_on", models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="habit",
+            name="streak_points",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="PointsEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("habit", "Habit"),
+                            ("completion", "Completion"),
+                            ("achievement", "Achievement"),
+                            ("streak", "Streak Bonus"),
+                            ("adjustment", "Adjustment"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("points", models.IntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "habit",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="habits.habit",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "points entries",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.RunPython(open_points_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-18 18:51
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_perfect_streaks(apps, schema_editor):
+    DailyUserStats = apps.get_model("habits", "DailyUserStats")
+
+    rows = []
+    previous = None
+    for stats in DailyUserStats.objects.order_by("user_id", "date").iterator(
+        chunk_size=2000
+    ):
+        if stats.perfect_day:
+            extends = (
+                previous is not None
+                and previous.user_id == stats.user_id
+                and previous.date == stats.date - timedelta(days=1)
+            )
+            stats.perfect_streak = previous.perfect_streak + 1 if extends else 1
+            rows.append(stats)
+        previous = stats
+
+    DailyUserStats.objects.bulk_update(rows, ["perfect_streak"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0007_points_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dailyuserstats",
+            name="perfect_streak",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_perfect_streaks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2 on 2026-10-18 19:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("habits", "0008_dailyuserstats_perfect_streak"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncOperation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="habitcompletion",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="habitcompletion",
+            index=models.Index(
+                fields=["updated_at"], name="habits_habi_updated_ac73d1_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="syncoperation",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="syncoperation",
+            index=models.Index(
+                fields=["user", "created_at"], name="habits_sync_user_id_e9972c_idx"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="syncoperation",
+            unique_together={("user", "key")},
+        ),
+    ]
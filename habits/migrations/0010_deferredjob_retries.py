@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-18 19:34
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0009_sync_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deferredjob",
+            name="attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="deferredjob",
+            name="run_after",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
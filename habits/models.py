@@ -1,8 +1,33 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
 
+class HabitQuerySet(models.QuerySet):
+    def attach_streaks(self):
+        """Fetch the habits as a list, with streak state computed from completions in one query"""
+        from .streak_service import load_streaks
+        return load_streaks(self)
+    
+    def with_today(self):
+        """Annotate completed_today, read by is_completed_today() instead of a query per habit"""
+        today = timezone.now().date()
+        return self.annotate(completed_today=models.Exists(
+            HabitCompletion.objects.filter(habit=models.OuterRef('pk'), date=today, completed=True)
+        ))
+    
+    def with_total_completions(self):
+        """Annotate total_completions, read by get_total_completions() instead of a query per habit"""
+        completions = HabitCompletion.objects.filter(
+            habit=models.OuterRef('pk'),
+            completed=True
+        ).values('habit').annotate(count=models.Count('id')).values('count')
+        return self.annotate(total_completions=Coalesce(
+            models.Subquery(completions), 0
+        ))
+
+
 class Habit(models.Model):
     CATEGORY_CHOICES = [
         ('health', 'Health'),
@@ -20,59 +45,95 @@ class Habit(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     
+    # Streak state, maintained by apply_completion() and the rebuild_streaks command
+    current_streak = models.PositiveIntegerField(default=0)
+    longest_streak = models.PositiveIntegerField(default=0)
+    streak_start_date = models.DateField(null=True, blank=True)
+    last_completed_date = models.DateField(null=True, blank=True)
+    
+    # Streak bonus currently credited to the user's points for this habit
+    streak_points = models.IntegerField(default=0)
+    
+    STREAK_FIELDS = ['current_streak', 'longest_streak', 'streak_start_date', 'last_completed_date']
+    
+    objects = HabitQuerySet.as_manager()
+    
     def __str__(self):
         return self.name
     
     def get_current_streak(self):
-        """Calculate current streak of consecutive days - resets if missed yesterday"""
-        today = timezone.now().date()
-        yesterday = today - timedelta(days=1)
-        
-        # Check if completed today OR yesterday (for continuity)
-        completed_today = self.habitcompletion_set.filter(
-            date=today,
-            completed=True
-        ).exists()
-        
-        completed_yesterday = self.habitcompletion_set.filter(
-            date=yesterday,
-            completed=True
-        ).exists()
-        
-        # If didn't complete today AND didn't complete yesterday, streak is broken
-        if not completed_today and not completed_yesterday:
+        """Current streak of consecutive days - resets if missed yesterday"""
+        if self.last_completed_date is None:
             return 0
-        
-        # Count backwards from today or yesterday
-        start_date = today if completed_today else yesterday
-        streak = 0
-        check_date = start_date
-        
-        while True:
-            completion = self.habitcompletion_set.filter(
-                date=check_date,
-                completed=True
-            ).exists()
-            
-            if completion:
-                streak += 1
-                check_date -= timedelta(days=1)
+
+        yesterday = timezone.now().date() - timedelta(days=1)
+
+        # Stored streak ends on the last completed day, so it only counts if that is today or yesterday
+        if self.last_completed_date < yesterday:
+            return 0
+
+        return self.current_streak
+
+    def apply_completion(self, date, completed, save=True, rebuild=True):
+        """Update stored streak state after the completion for date was toggled"""
+        # With rebuild off, returns False where the state has to be rebuilt from completions
+        last = self.last_completed_date
+
+        if completed:
+            if last is None or date > last + timedelta(days=1):
+                # Missed at least one day, start a new streak
+                self.current_streak = 1
+                self.streak_start_date = date
+            elif date == last + timedelta(days=1):
+                self.current_streak += 1
+            elif date == last:
+                return True
             else:
-                break
-        
-        return streak
-    
+                # Back-filling an older day can merge streaks
+                return self._rebuild_after_toggle(rebuild)
+            self.last_completed_date = date
+            self.longest_streak = max(self.longest_streak, self.current_streak)
+        else:
+            if last is None or date > last:
+                return True
+            if date == last and self.current_streak > 1 and self.longest_streak > self.current_streak:
+                # Longest streak belongs to an older run, so it is unaffected
+                self.current_streak -= 1
+                self.last_completed_date = date - timedelta(days=1)
+            else:
+                return self._rebuild_after_toggle(rebuild)
+
+        if save:
+            self.save(update_fields=self.STREAK_FIELDS)
+        return True
+
+    def _rebuild_after_toggle(self, rebuild):
+        if rebuild:
+            self.rebuild_streak()
+        return rebuild
+
+    def rebuild_streak(self):
+        """Recalculate stored streak state from this habit's completions"""
+        from .streak_service import rebuild_streaks
+        rebuild_streaks([self])
+
     def get_total_completions(self):
         """Get total number of times this habit was completed"""
-        return self.habitcompletion_set.filter(completed=True).count()
+        # Annotated by with_total_completions(), or memoized for the life of the instance
+        if not hasattr(self, 'total_completions'):
+            self.total_completions = self.habitcompletion_set.filter(completed=True).count()
+        return self.total_completions
     
     def is_completed_today(self):
         """Check if habit was completed today"""
-        today = timezone.now().date()
-        return self.habitcompletion_set.filter(
-            date=today,
-            completed=True
-        ).exists()
+        # Annotated by with_today(), or memoized for the life of the instance
+        if not hasattr(self, 'completed_today'):
+            today = timezone.now().date()
+            self.completed_today = self.habitcompletion_set.filter(
+                date=today,
+                completed=True
+            ).exists()
+        return self.completed_today
     
     class Meta:
         ordering = ['-created_at']
@@ -83,6 +144,8 @@ class HabitCompletion(models.Model):
     date = models.DateField(default=timezone.now)
     completed = models.BooleanField(default=False)
     notes = models.TextField(blank=True)
+    # Read by the sync API to send clients what changed since their last sync
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.habit.name} - {self.date}"
@@ -90,6 +153,69 @@ class HabitCompletion(models.Model):
     class Meta:
         unique_together = ['habit', 'date']
         ordering = ['-date']
+        indexes = [models.Index(fields=['updated_at'])]
+
+
+class CompletionBitmap(models.Model):
+    """Compact completion history, one bit per day of the year for a habit"""
+    BYTES = 46  # 366 days
+    
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField()
+    bits = models.BinaryField(default=bytes(BYTES))
+    
+    def __str__(self):
+        return f"{self.habit.name} - {self.year}"
+    
+    def as_int(self):
+        """Bitmap as an integer, bit N is day N of the year counting from 0"""
+        return int.from_bytes(bytes(self.bits), 'little')
+    
+    def set_int(self, value):
+        self.bits = value.to_bytes(self.BYTES, 'little')
+    
+    def is_completed(self, date):
+        return bool(self.as_int() >> day_index(date) & 1)
+    
+    def set_completed(self, date, completed):
+        value = self.as_int()
+        if completed:
+            value |= 1 << day_index(date)
+        else:
+            value &= ~(1 << day_index(date))
+        self.set_int(value)
+    
+    class Meta:
+        unique_together = ['habit', 'year']
+        ordering = ['-year']
+
+
+class DailyUserStats(models.Model):
+    """Per-user daily rollup of habit completions, kept up to date by rollup_service"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    # Completions of habits that are still active
+    completions = models.PositiveIntegerField(default=0)
+    active_habits = models.PositiveIntegerField(default=0)
+    perfect_day = models.BooleanField(default=False)
+    # Consecutive perfect days ending on this date
+    perfect_streak = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.date}"
+    
+    def update_perfect_day(self):
+        self.perfect_day = self.active_habits > 0 and self.completions >= self.active_habits
+    
+    class Meta:
+        unique_together = ['user', 'date']
+        ordering = ['-date']
+        verbose_name_plural = 'daily user stats'
+
+
+def day_index(date):
+    """Position of date within its year's bitmap"""
+    return date.timetuple().tm_yday - 1
 
 
 class Achievement(models.Model):
@@ -111,10 +237,12 @@ class Achievement(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     achievement_type = models.CharField(max_length=50, choices=ACHIEVEMENT_TYPES)
     earned_date = models.DateTimeField(auto_now_add=True)
+    notified = models.BooleanField(default=False)
     
     class Meta:
         unique_together = ['user', 'achievement_type']
         ordering = ['-earned_date']
+        indexes = [models.Index(fields=['user', 'notified'])]
     
     def __str__(self):
         return f"{self.user.username} - {self.get_achievement_type_display()}"
@@ -151,4 +279,72 @@ class Achievement(models.Model):
             'perfect_week': 'bg-primary',
             'perfect_month': 'bg-success',
         }
-        return colors.get(self.achievement_type, 'bg-secondary')
\ No newline at end of file
+        return colors.get(self.achievement_type, 'bg-secondary')
+
+
+class DeferredJob(models.Model):
+    """Derived-state work waiting for the process_jobs worker, one row per user, task and event"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    task = models.CharField(max_length=50)
+    event = models.CharField(max_length=50, blank=True)
+    # Refreshed when the job is queued again
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Failed runs so far, and when the job may next be claimed
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.task} ({self.event}) for {self.user.username}"
+    
+    class Meta:
+        unique_together = ['user', 'task', 'event']
+        ordering = ['id']
+
+
+class SyncOperation(models.Model):
+    """Idempotency key of a client operation already applied by the sync API"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.key} for {self.user.username}"
+    
+    class Meta:
+        unique_together = ['user', 'key']
+        indexes = [models.Index(fields=['user', 'created_at'])]
+
+
+class PointsEntry(models.Model):
+    """Append-only ledger of points awarded to or taken back from a user"""
+    REASON_CHOICES = [
+        ('habit', 'Habit'),
+        ('completion', 'Completion'),
+        ('achievement', 'Achievement'),
+        ('streak', 'Streak Bonus'),
+        ('adjustment', 'Adjustment'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    points = models.IntegerField()
+    habit = models.ForeignKey(Habit, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.user.username} {self.points:+d} ({self.get_reason_display()})"
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'points entries'
+
+
+class UserPoints(models.Model):
+    """Running total of a user's points ledger"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    total = models.IntegerField(default=0)
+    # Last day lapsed streak bonuses were taken back
+    settled_on = models.DateField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.total} points"
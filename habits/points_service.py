@@ -0,0 +1,153 @@
+from .models import Achievement, Habit, HabitCompletion, PointsEntry, UserPoints
+from .signals import user_data_changed
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from datetime import timedelta
+
+HABIT_POINTS = 10
+COMPLETION_POINTS = 5
+ACHIEVEMENT_POINTS = 100
+STREAK_POINTS = 2  # per day of a current streak
+
+
+def award_points(user, entries):
+    """Append ledger entries and move the user's running total in the same transaction"""
+    entries = [entry for entry in entries if entry.points]
+    if not entries:
+        return
+
+    delta = sum(entry.points for entry in entries)
+    with transaction.atomic():
+        PointsEntry.objects.bulk_create(entries)
+        if not UserPoints.objects.filter(user=user).update(total=F('total') + delta):
+            # Recreate a missing running total row
+            points, created = UserPoints.objects.get_or_create(user=user)
+            UserPoints.objects.filter(user=user).update(total=F('total') + delta)
+    user_data_changed.send(sender=UserPoints, user_id=user.pk)
+
+
+def streak_entry(habit):
+    """Ledger entry bringing the habit's credited streak bonus in line with its current streak"""
+    target = STREAK_POINTS * habit.get_current_streak() if habit.is_active else 0
+    entry = PointsEntry(user_id=habit.user_id, reason='streak', points=target - habit.streak_points, habit=habit)
+    habit.streak_points = target
+    return entry
+
+
+def record_habit_created(habit):
+    award_points(habit.user, [PointsEntry(user=habit.user, reason='habit', points=HABIT_POINTS, habit=habit)])
+
+
+def record_habit_deleted(habit):
+    """Take back the habit's points and streak bonus once it is no longer active"""
+    entries = [
+        PointsEntry(user=habit.user, reason='habit', points=-HABIT_POINTS, habit=habit),
+        streak_entry(habit),
+    ]
+    habit.save(update_fields=['streak_points'])
+    award_points(habit.user, entries)
+
+
+def record_completion_points(habit, completed):
+    """Points for a toggled completion, after the habit's streak state was updated"""
+    points = COMPLETION_POINTS if completed else -COMPLETION_POINTS
+    entries = [
+        PointsEntry(user=habit.user, reason='completion', points=points, habit=habit),
+        streak_entry(habit),
+    ]
+    if entries[1].points:
+        habit.save(update_fields=['streak_points'])
+    award_points(habit.user, entries)
+
+
+def record_bulk_completion_points(user, habits, states):
+    """Points for toggles of many habits, states maps habit ids to their new state, written in one batch"""
+    entries = []
+    for habit in habits:
+        points = COMPLETION_POINTS if states[habit.pk] else -COMPLETION_POINTS
+        entries.append(PointsEntry(user=user, reason='completion', points=points, habit=habit))
+        entries.append(streak_entry(habit))
+    Habit.objects.bulk_update(habits, ['streak_points'])
+    award_points(user, entries)
+
+
+def record_achievement_points(user, achievements):
+    award_points(user, [
+        PointsEntry(user=user, reason='achievement', points=ACHIEVEMENT_POINTS)
+        for achievement in achievements
+    ])
+
+
+def settle_streak_points(user):
+    """Take back streak bonuses for streaks that lapsed without a toggle, once a day"""
+    today = timezone.now().date()
+    with transaction.atomic():
+        # Concurrent settles queue on the running total row, the later ones find it settled.
+        # select_for_update() reads from the primary even inside views reading from a replica.
+        points = UserPoints.objects.select_for_update().filter(user=user).first()
+        if points is not None and points.settled_on == today:
+            return
+
+        lapsed = list(Habit.objects.select_for_update().filter(
+            user=user,
+            streak_points__gt=0,
+            last_completed_date__lt=today - timedelta(days=1)
+        ))
+        entries = [streak_entry(habit) for habit in lapsed]
+        Habit.objects.bulk_update(lapsed, ['streak_points'])
+        award_points(user, entries)
+        UserPoints.objects.filter(user=user).update(settled_on=today)
+
+
+def get_user_points(user):
+    """Total points for user, read from the running total"""
+    points = UserPoints.objects.filter(user=user).first()
+    if points is None:
+        return 0
+
+    # Streaks can lapse overnight without any write, so settle once a day
+    if points.settled_on != timezone.now().date():
+        settle_streak_points(user)
+        # The settle wrote to the primary, a replica may not have the new total yet
+        points = UserPoints.objects.using('default').get(user=user)
+
+    return points.total
+
+
+def expected_points(user):
+    """Points recalculated from the source tables, the way they were before the ledger"""
+    habits = list(Habit.objects.filter(user=user, is_active=True))
+    completions = HabitCompletion.objects.filter(habit__user=user, completed=True).count()
+    achievements = Achievement.objects.filter(user=user).count()
+    streaks = sum(habit.get_current_streak() for habit in habits)
+
+    return (
+        len(habits) * HABIT_POINTS
+        + completions * COMPLETION_POINTS
+        + achievements * ACHIEVEMENT_POINTS
+        + streaks * STREAK_POINTS
+    )
+
+
+def reconcile_points(user, fix=False):
+    """Compare ledger, running total and source tables, optionally posting a correcting entry"""
+    expected = expected_points(user)
+    ledger = PointsEntry.objects.filter(user=user).aggregate(total=Sum('points'))['total'] or 0
+    points, created = UserPoints.objects.get_or_create(user=user)
+    result = {'expected': expected, 'ledger': ledger, 'total': points.total}
+
+    if fix and (ledger != expected or points.total != expected):
+        with transaction.atomic():
+            # Re-credit streak bonuses so later deltas start from the right baseline
+            habits = list(Habit.objects.filter(user=user))
+            for habit in habits:
+                habit.streak_points = STREAK_POINTS * habit.get_current_streak() if habit.is_active else 0
+            Habit.objects.bulk_update(habits, ['streak_points'])
+
+            if ledger != expected:
+                PointsEntry.objects.create(user=user, reason='adjustment', points=expected - ledger)
+            UserPoints.objects.filter(user=user).update(total=expected, settled_on=timezone.now().date())
+        user_data_changed.send(sender=UserPoints, user_id=user.pk)
+
+    return result
@@ -0,0 +1,126 @@
+from .models import DailyUserStats, Habit, HabitCompletion
+from .signals import user_data_changed
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from bisect import bisect_right
+from datetime import timedelta
+
+
+def record_completion(user, date, delta):
+    """Add delta to the user's completion count for date, for completions of active habits only"""
+    with transaction.atomic():
+        stats = _locked_stats(user, date)
+        stats.completions = max(stats.completions + delta, 0)
+        _update_perfect(stats)
+        stats.save()
+    return stats
+
+
+def refresh_active_habits(user, date=None):
+    """Recount the user's active habits and their completions after one was created or deleted"""
+    date = date or timezone.now().date()
+    with transaction.atomic():
+        stats = _locked_stats(user, date)
+        stats.active_habits = Habit.objects.filter(user=user, is_active=True).count()
+        # A deleted habit's completion no longer counts towards a perfect day
+        stats.completions = HabitCompletion.objects.filter(
+            habit__user=user,
+            habit__is_active=True,
+            date=date,
+            completed=True
+        ).count()
+        _update_perfect(stats)
+        stats.save()
+    return stats
+
+
+def perfect_streak_length(user, date=None):
+    """Consecutive perfect days ending on date (default today), a single row lookup"""
+    date = date or timezone.now().date()
+    return DailyUserStats.objects.filter(user=user, date=date).values_list(
+        'perfect_streak', flat=True
+    ).first() or 0
+
+
+def rebuild_daily_stats(user):
+    """Recreate the user's rollup rows from HabitCompletion"""
+    # Habits deleted since then are not counted, as their deletion date is not stored
+    created_dates = sorted(
+        timezone.localtime(created_at).date()
+        for created_at in Habit.objects.filter(user=user, is_active=True).values_list('created_at', flat=True)
+    )
+
+    counts = HabitCompletion.objects.filter(
+        habit__user=user,
+        habit__is_active=True,
+        completed=True
+    ).values('date').annotate(completions=Count('id')).order_by('date')
+
+    rows = []
+    for row in counts:
+        rows.append(DailyUserStats(
+            user=user,
+            date=row['date'],
+            completions=row['completions'],
+            active_habits=bisect_right(created_dates, row['date'])
+        ))
+
+    today = timezone.now().date()
+    if not rows or rows[-1].date != today:
+        # Today's row carries the current habit count even before anything is completed
+        rows.append(DailyUserStats(user=user, date=today, active_habits=len(created_dates)))
+
+    previous = None
+    for stats in rows:
+        stats.update_perfect_day()
+        if stats.perfect_day:
+            extends = previous is not None and previous.date == stats.date - timedelta(days=1)
+            stats.perfect_streak = previous.perfect_streak + 1 if extends else 1
+        previous = stats
+
+    with transaction.atomic():
+        DailyUserStats.objects.filter(user=user).delete()
+        DailyUserStats.objects.bulk_create(rows, batch_size=500)
+    user_data_changed.send(sender=DailyUserStats, user_id=user.pk)
+
+    return rows
+
+
+def _update_perfect(stats):
+    """Recalculate the perfect-day flag, extending or resetting the perfect streak if it flipped"""
+    was_perfect = stats.perfect_day
+    stats.update_perfect_day()
+    if stats.perfect_day == was_perfect:
+        return
+
+    if stats.perfect_day:
+        previous = perfect_streak_length(stats.user_id, stats.date - timedelta(days=1))
+        stats.perfect_streak = previous + 1
+    else:
+        stats.perfect_streak = 0
+
+    # Perfect days right after this one count their streak through it
+    following = []
+    expected = stats.date + timedelta(days=1)
+    rows = DailyUserStats.objects.select_for_update().filter(
+        user_id=stats.user_id,
+        date__gt=stats.date,
+        perfect_day=True
+    ).order_by('date')
+    for row in rows:
+        if row.date != expected:
+            break
+        row.perfect_streak = (following[-1] if following else stats).perfect_streak + 1
+        following.append(row)
+        expected += timedelta(days=1)
+    DailyUserStats.objects.bulk_update(following, ['perfect_streak'])
+
+
+def _locked_stats(user, date):
+    stats, created = DailyUserStats.objects.select_for_update().get_or_create(
+        user=user,
+        date=date,
+        defaults={'active_habits': lambda: Habit.objects.filter(user=user, is_active=True).count()}
+    )
+    return stats
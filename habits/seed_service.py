@@ -0,0 +1,60 @@
+from .models import Habit, HabitCompletion
+from .achievement_service import check_and_award_achievements
+from .bitmap_service import rebuild_bitmaps
+from .points_service import reconcile_points
+from .rollup_service import rebuild_daily_stats
+from .streak_service import rebuild_streaks
+from django.contrib.auth.models import User
+from django.utils import timezone
+from todos.models import Todo
+from datetime import timedelta
+import random
+
+COMPLETIONS_BATCH_SIZE = 5000
+
+
+def seed_user(username, habits=50, days=730, todos=2000, density=0.8, seed=0, password=None):
+    """Create a user with synthetic history and every derived table rebuilt, for tests and benchmarks"""
+    rng = random.Random(seed)
+    today = timezone.now().date()
+    categories = [choice for choice, label in Habit.CATEGORY_CHOICES]
+    priorities = [choice for choice, label in Todo.PRIORITY_CHOICES]
+
+    user = User.objects.create_user(username, password=password)
+
+    habit_objects = Habit.objects.bulk_create([
+        Habit(user=user, name=f'Habit {i}', category=categories[i % len(categories)])
+        for i in range(habits)
+    ])
+    # Habits existed for the whole history, so past days can be perfect days
+    Habit.objects.filter(user=user).update(created_at=timezone.now() - timedelta(days=days))
+
+    completions = [
+        HabitCompletion(habit=habit, date=today - timedelta(days=days_ago), completed=True)
+        for habit in habit_objects
+        for days_ago in range(days)
+        if rng.random() < density
+    ]
+    HabitCompletion.objects.bulk_create(completions, batch_size=COMPLETIONS_BATCH_SIZE)
+
+    todo_objects = []
+    for i in range(todos):
+        completed = rng.random() < 0.5
+        todo_objects.append(Todo(
+            user=user,
+            title=f'Todo {i}',
+            priority=rng.choice(priorities),
+            completed=completed,
+            completed_at=timezone.now() - timedelta(days=rng.randrange(max(days, 1))) if completed else None,
+        ))
+    Todo.objects.bulk_create(todo_objects, batch_size=COMPLETIONS_BATCH_SIZE)
+
+    # bulk_create skips the signals and incremental updates, so rebuild derived state once
+    habit_objects = list(Habit.objects.filter(user=user))
+    rebuild_streaks(habit_objects)
+    rebuild_bitmaps(habit_objects)
+    rebuild_daily_stats(user)
+    check_and_award_achievements(user)
+    reconcile_points(user, fix=True)
+
+    return user
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from .models import HabitCompletion, UserPoints
+from .bitmap_service import set_completion_bit
+
+# Sent with user_id after writes that bypass model signals (bulk_create, update)
+user_data_changed = Signal()
+
+
+@receiver(post_save, sender=HabitCompletion)
+def sync_bitmap_on_save(sender, instance, **kwargs):
+    set_completion_bit(instance.habit_id, instance.date, instance.completed)
+
+
+@receiver(post_delete, sender=HabitCompletion)
+def sync_bitmap_on_delete(sender, instance, **kwargs):
+    set_completion_bit(instance.habit_id, instance.date, False)
+
+
+@receiver(post_save, sender=User)
+def open_points_on_signup(sender, instance, created, **kwargs):
+    if created:
+        UserPoints.objects.get_or_create(user=instance, defaults={'settled_on': timezone.now().date()})
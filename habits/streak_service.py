@@ -0,0 +1,145 @@
+from .models import Habit, HabitCompletion
+from .signals import user_data_changed
+from django.db import connection
+from django.utils import timezone
+from datetime import date as date_cls, timedelta
+
+# SQL turning a date column into a whole day number, so consecutive days differ by one
+DAY_NUMBER_SQL = {
+    'sqlite': 'CAST(julianday({column}) AS INTEGER)',
+    'postgresql': "({column} - DATE '1970-01-01')",
+    'mysql': 'TO_DAYS({column})',
+}
+
+# Gaps-and-islands: day number minus row number is constant within a run of consecutive days.
+# Returns the most recent run and the longest run length per habit.
+STREAKS_SQL = """
+WITH days AS (
+    SELECT habit_id, date,
+           {day_number} - ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY date) AS island
+    FROM {table}
+    WHERE completed = %s AND date <= %s AND habit_id IN ({habit_ids})
+),
+islands AS (
+    SELECT habit_id,
+           MIN(date) AS start_date,
+           MAX(date) AS end_date,
+           COUNT(*) AS length,
+           ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY MAX(date) DESC) AS recency,
+           MAX(COUNT(*)) OVER (PARTITION BY habit_id) AS longest
+    FROM days
+    GROUP BY habit_id, island
+)
+SELECT habit_id, start_date, end_date, length, longest
+FROM islands
+WHERE recency = 1
+"""
+
+# Keeps the IN list below SQLite's bound parameter limit
+STREAKS_BATCH_SIZE = 500
+
+
+def compute_streak_state(dates):
+    """Calculate streak fields from completed dates sorted oldest first"""
+    current_streak = 0
+    longest_streak = 0
+    streak_start_date = None
+    last_completed_date = None
+
+    for date in dates:
+        if last_completed_date is not None and date == last_completed_date + timedelta(days=1):
+            current_streak += 1
+        elif date != last_completed_date:
+            current_streak = 1
+            streak_start_date = date
+        last_completed_date = date
+        longest_streak = max(longest_streak, current_streak)
+
+    return {
+        'current_streak': current_streak,
+        'longest_streak': longest_streak,
+        'streak_start_date': streak_start_date,
+        'last_completed_date': last_completed_date,
+    }
+
+
+def load_streaks(habits):
+    """Set streak fields on habits from their completions without saving them"""
+    habits = list(habits)
+    today = timezone.now().date()
+
+    if connection.vendor in DAY_NUMBER_SQL:
+        states = _query_streak_states(habits, today)
+    else:
+        states = _compute_streak_states(habits, today)
+
+    empty = compute_streak_state([])
+    for habit in habits:
+        for field, value in states.get(habit.pk, empty).items():
+            setattr(habit, field, value)
+
+    return habits
+
+
+def rebuild_streaks(habits):
+    """Recalculate stored streak state from HabitCompletion rows, returns habits that drifted"""
+    habits = list(habits)
+    stored = {habit.pk: [getattr(habit, field) for field in Habit.STREAK_FIELDS] for habit in habits}
+
+    load_streaks(habits)
+
+    drifted = [
+        habit for habit in habits
+        if [getattr(habit, field) for field in Habit.STREAK_FIELDS] != stored[habit.pk]
+    ]
+    Habit.objects.bulk_update(drifted, Habit.STREAK_FIELDS)
+    for user_id in {habit.user_id for habit in drifted}:
+        user_data_changed.send(sender=Habit, user_id=user_id)
+    return drifted
+
+
+def _query_streak_states(habits, today):
+    """Run the gaps-and-islands query for habits in batches"""
+    quote = connection.ops.quote_name
+    states = {}
+
+    for offset in range(0, len(habits), STREAKS_BATCH_SIZE):
+        habit_ids = [habit.pk for habit in habits[offset:offset + STREAKS_BATCH_SIZE]]
+        sql = STREAKS_SQL.format(
+            day_number=DAY_NUMBER_SQL[connection.vendor].format(column='date'),
+            table=quote(HabitCompletion._meta.db_table),
+            habit_ids=', '.join(['%s'] * len(habit_ids)),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [True, today] + habit_ids)
+            for habit_id, start_date, end_date, length, longest in cursor.fetchall():
+                states[habit_id] = {
+                    'current_streak': length,
+                    'longest_streak': longest,
+                    'streak_start_date': _to_date(start_date),
+                    'last_completed_date': _to_date(end_date),
+                }
+
+    return states
+
+
+def _compute_streak_states(habits, today):
+    """Fallback for databases without a day number expression"""
+    dates_by_habit = {habit.pk: [] for habit in habits}
+    completions = HabitCompletion.objects.filter(
+        habit__in=habits,
+        completed=True,
+        date__lte=today
+    ).order_by('habit_id', 'date').values_list('habit_id', 'date')
+
+    for habit_id, date in completions:
+        dates_by_habit[habit_id].append(date)
+
+    return {habit_id: compute_streak_state(dates) for habit_id, dates in dates_by_habit.items()}
+
+
+def _to_date(value):
+    # Aggregates over date columns come back as ISO strings on SQLite
+    if isinstance(value, str):
+        return date_cls.fromisoformat(value)
+    return value
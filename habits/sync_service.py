@@ -0,0 +1,284 @@
+from .models import Habit, HabitCompletion, SyncOperation
+from .achievement_service import COMPLETION_TOGGLED
+from .completion_service import set_completions
+from .job_service import dispatch
+from .signals import user_data_changed
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from todos.models import Todo, TodoTombstone
+from collections import defaultdict
+from datetime import timedelta
+
+MAX_OPERATIONS = 500
+
+# A first sync only sends this much completion history
+INITIAL_SYNC_DAYS = 90
+
+# Idempotency keys older than this are forgotten, clients retry long before
+KEY_RETENTION_DAYS = 30
+
+OPERATION_TYPES = {'completion.set', 'todo.create', 'todo.toggle', 'todo.delete'}
+
+
+class SyncError(ValueError):
+    """The batch as a whole cannot be applied"""
+
+
+def sync(user, operations, since=None):
+    """Apply a batch of client operations in one transaction and return server changes since the last sync"""
+    if not isinstance(operations, list) or len(operations) > MAX_OPERATIONS:
+        raise SyncError(f'operations must be a list of at most {MAX_OPERATIONS} items')
+
+    since_time = None
+    if since:
+        since_time = _parse(parse_datetime, since)
+        if since_time is None:
+            raise SyncError('since must be a token returned by an earlier sync')
+
+    # Taken before writing, so the next sync also returns anything committed meanwhile
+    token = timezone.now()
+    result = {'applied': [], 'duplicates': [], 'rejected': [], 'created': {}}
+
+    with transaction.atomic():
+        operations = _accept_operations(user, operations, result)
+        completions_changed = _apply_completions(user, operations['completion.set'], result)
+        _apply_todos(user, operations, result)
+
+        SyncOperation.objects.bulk_create(
+            [SyncOperation(user=user, key=key) for key in result['applied']],
+            ignore_conflicts=True
+        )
+        SyncOperation.objects.filter(
+            user=user,
+            created_at__lt=token - timedelta(days=KEY_RETENTION_DAYS)
+        ).delete()
+
+    if completions_changed:
+        dispatch(user, 'achievements', COMPLETION_TOGGLED)
+
+    result['token'] = token.isoformat()
+    result.update(changes_since(user, since_time))
+    return result
+
+
+def changes_since(user, since=None):
+    """Compact server state changed since a sync token, or recent state for a first sync"""
+    completions = HabitCompletion.objects.filter(habit__user=user)
+    todos = Todo.objects.filter(user=user)
+    tombstones = TodoTombstone.objects.filter(user=user)
+    if since:
+        completions = completions.filter(updated_at__gte=since)
+        todos = todos.filter(updated_at__gte=since)
+        tombstones = tombstones.filter(deleted_at__gte=since)
+    else:
+        completions = completions.filter(date__gte=timezone.now().date() - timedelta(days=INITIAL_SYNC_DAYS))
+        tombstones = tombstones.none()
+
+    return {
+        'habits': [
+            {'id': habit.pk, 'name': habit.name, 'category': habit.category, 'streak': habit.get_current_streak()}
+            for habit in Habit.objects.filter(user=user, is_active=True).only(
+                'name', 'category', 'current_streak', 'last_completed_date'
+            )
+        ],
+        # [habit id, date, completed] rows
+        'completions': [
+            [habit_id, date.isoformat(), completed]
+            for habit_id, date, completed in completions.values_list('habit_id', 'date', 'completed')
+        ],
+        'todos': [
+            {
+                'id': todo['id'],
+                'title': todo['title'],
+                'description': todo['description'],
+                'priority': todo['priority'],
+                'completed': todo['completed'],
+                'due_date': todo['due_date'].isoformat() if todo['due_date'] else None,
+            }
+            for todo in todos.values('id', 'title', 'description', 'priority', 'completed', 'due_date')
+        ],
+        'deleted_todos': list(tombstones.values_list('todo_id', flat=True)),
+    }
+
+
+def _parse(parser, value):
+    """Parsed client date or datetime, None if missing or malformed"""
+    if not isinstance(value, str):
+        return None
+    try:
+        return parser(value)
+    except ValueError:
+        return None
+
+
+def _is_id(value):
+    """Whether a client value can be a primary key, bools are ints but never ids"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _accept_operations(user, operations, result):
+    """Drop replayed keys and invalid operations, grouping the rest by type in client order"""
+    keys = [op.get('key') for op in operations if isinstance(op, dict) and isinstance(op.get('key'), str)]
+    seen = set(SyncOperation.objects.filter(user=user, key__in=keys).values_list('key', flat=True))
+    accepted = defaultdict(list)
+
+    # Clients stamp operations when they happen, so replay them in that order
+    timestamped = []
+    now = timezone.now()
+    for op in operations:
+        stamp = op.get('at') if isinstance(op, dict) else None
+        at = _parse(parse_datetime, stamp)
+        valid = at is not None or stamp is None
+        if at is None:
+            # Malformed stamps sort with the unstamped operations and are rejected below
+            at = now
+        elif timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        timestamped.append((at, valid, op))
+    timestamped.sort(key=lambda item: item[0])
+
+    for at, valid, op in timestamped:
+        key = op.get('key') if isinstance(op, dict) else None
+        if not isinstance(key, str) or not key or len(key) > 64:
+            result['rejected'].append({'key': key, 'error': 'missing or invalid key'})
+            continue
+        if key in seen:
+            result['duplicates'].append(key)
+            continue
+        seen.add(key)
+
+        if not isinstance(op.get('type'), str) or op['type'] not in OPERATION_TYPES:
+            result['rejected'].append({'key': key, 'error': 'unknown operation type'})
+            continue
+        if not valid:
+            result['rejected'].append({'key': key, 'error': 'invalid at'})
+            continue
+
+        op = dict(op, at=at)
+        accepted[op['type']].append(op)
+
+    return accepted
+
+
+def _apply_completions(user, operations, result):
+    """Upsert the final state of every habit and date, one set-based write per date"""
+    # Habit id -> the first day it can have completions
+    owned = {
+        habit_id: timezone.localtime(created_at).date()
+        for habit_id, created_at in Habit.objects.filter(
+            user=user,
+            is_active=True,
+            pk__in=[op.get('habit') for op in operations if _is_id(op.get('habit'))]
+        ).values_list('pk', 'created_at')
+    }
+
+    today = timezone.now().date()
+    final = {}
+    for op in operations:
+        date = _parse(parse_date, op.get('date'))
+        completed = op.get('completed', True)
+        if not _is_id(op.get('habit')) or op['habit'] not in owned or date is None:
+            result['rejected'].append({'key': op['key'], 'error': 'unknown habit or invalid date'})
+        elif not owned[op['habit']] <= date <= today:
+            result['rejected'].append({'key': op['key'], 'error': 'date before the habit was created or in the future'})
+        elif not isinstance(completed, bool):
+            result['rejected'].append({'key': op['key'], 'error': 'completed must be true or false'})
+        else:
+            # Later operations on the same habit and day win
+            final[(op['habit'], date)] = (completed, op)
+
+    # Server rows changed after the client's operation are newer, keep them
+    updated = {
+        (habit_id, date): updated_at
+        for habit_id, date, updated_at in HabitCompletion.objects.filter(
+            habit_id__in={habit_id for habit_id, date in final},
+            date__in={date for habit_id, date in final}
+        ).values_list('habit_id', 'date', 'updated_at')
+    }
+
+    states = defaultdict(dict)
+    for (habit_id, date), (completed, op) in final.items():
+        if (habit_id, date) in updated and updated[(habit_id, date)] > op['at']:
+            result['rejected'].append({'key': op['key'], 'error': 'stale'})
+            continue
+        states[date][habit_id] = completed
+
+    changed = False
+    for date, date_states in states.items():
+        changed = bool(set_completions(user, date_states, date)) or changed
+
+    # Superseded operations count as applied, their effect was overwritten by a later one
+    # Malformed keys are echoed back as sent, only string keys can match an operation here
+    rejected = {entry['key'] for entry in result['rejected'] if isinstance(entry['key'], str)}
+    result['applied'] += [op['key'] for op in operations if op['key'] not in rejected]
+    return changed
+
+
+def _apply_todos(user, operations, result):
+    """Create, toggle and delete todos with one write per kind"""
+    creates = []
+    for op in operations['todo.create']:
+        title = op.get('title')
+        if not isinstance(title, str) or not title.strip() or len(title) > 200:
+            result['rejected'].append({'key': op['key'], 'error': 'invalid title'})
+            continue
+        priority = op.get('priority', 'medium')
+        if not isinstance(priority, str) or priority not in dict(Todo.PRIORITY_CHOICES):
+            result['rejected'].append({'key': op['key'], 'error': 'invalid priority'})
+            continue
+        description = op.get('description') or ''
+        if not isinstance(description, str):
+            result['rejected'].append({'key': op['key'], 'error': 'invalid description'})
+            continue
+        due_date = _parse(parse_date, op.get('due_date'))
+        if due_date is None and op.get('due_date') is not None:
+            result['rejected'].append({'key': op['key'], 'error': 'invalid due_date'})
+            continue
+        creates.append((op, Todo(
+            user=user,
+            title=title,
+            description=description,
+            priority=priority,
+            due_date=due_date,
+        )))
+
+    Todo.objects.bulk_create([todo for op, todo in creates])
+    for op, todo in creates:
+        result['applied'].append(op['key'])
+        if op.get('client_id') is not None:
+            result['created'][str(op['client_id'])] = todo.pk
+
+    owned = set(Todo.objects.filter(user=user, pk__in=[
+        op.get('todo') for op in operations['todo.toggle'] + operations['todo.delete']
+        if _is_id(op.get('todo'))
+    ]).values_list('pk', flat=True))
+
+    now = timezone.now()
+    toggles = {}
+    deletes = []
+    for op in sorted(operations['todo.toggle'] + operations['todo.delete'], key=lambda op: op['at']):
+        if not _is_id(op.get('todo')) or op['todo'] not in owned:
+            result['rejected'].append({'key': op['key'], 'error': 'unknown todo'})
+            continue
+        if op['type'] == 'todo.toggle' and not isinstance(op.get('completed', True), bool):
+            result['rejected'].append({'key': op['key'], 'error': 'completed must be true or false'})
+            continue
+        result['applied'].append(op['key'])
+        if op['type'] == 'todo.delete':
+            deletes.append(op['todo'])
+        else:
+            # The last toggle of a todo decides its state
+            toggles[op['todo']] = op.get('completed', True)
+
+    targets = {True: [], False: []}
+    for todo_id, completed in toggles.items():
+        targets[completed].append(todo_id)
+
+    # update() skips save(), so stamp updated_at and invalidate snapshots here
+    Todo.objects.filter(pk__in=targets[True]).update(completed=True, completed_at=now, updated_at=now)
+    Todo.objects.filter(pk__in=targets[False]).update(completed=False, completed_at=None, updated_at=now)
+    Todo.objects.filter(pk__in=deletes).delete()
+
+    if creates or targets[True] or targets[False] or deletes:
+        user_data_changed.send(sender=Todo, user_id=user.pk)
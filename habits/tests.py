@@ -1,3 +1,820 @@
-from django.test import TestCase
+import io
+import json
+import random
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .achievement_service import (
+    COMPLETION_TOGGLED,
+    HABIT_CREATED,
+    AchievementContext,
+    check_and_award_achievements,
+    check_perfect_streak,
+)
+from .job_service import TASKS, process_jobs
+from .management.commands.loadtest import check_scratch_database
+from .bitmap_service import (
+    count_completions, load_bitmaps, perfect_days, popcount, rebuild_bitmaps, run_length, set_completion_bit,
+    streak_ending,
+)
+from .completion_service import set_completions
+from .export_service import export_chunks
+from .import_service import import_history
+from .models import Achievement, DailyUserStats, DeferredJob, Habit, HabitCompletion, PointsEntry, UserPoints
+from .points_service import expected_points, get_user_points, reconcile_points, settle_streak_points
+from .rollup_service import perfect_streak_length, rebuild_daily_stats
+from .signals import user_data_changed
+from .streak_service import rebuild_streaks
+from todos.models import Todo
+
+
+# Tests get a private in-memory cache, so cache.clear() leaves the shared
+# cache directory of a running server alone
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def walk_current_streak(dates, today):
+    """Reference day-by-day walk matching the original get_current_streak()"""
+    if today not in dates and today - timedelta(days=1) not in dates:
+        return 0
+
+    check_date = today if today in dates else today - timedelta(days=1)
+    streak = 0
+    while check_date in dates:
+        streak += 1
+        check_date -= timedelta(days=1)
+    return streak
+
+
+def walk_longest_streak(dates):
+    longest = current = 0
+    previous = None
+    for date in sorted(dates):
+        current = current + 1 if previous == date - timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = date
+    return longest
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AttachStreaksParityTests(TestCase):
+    def test_matches_day_walk_on_random_histories(self):
+        rng = random.Random(20240101)
+        user = User.objects.create_user('streaker')
+        today = timezone.now().date()
+
+        expected = {}
+        completions = []
+        for i in range(40):
+            habit = Habit.objects.create(user=user, name=f'Habit {i}')
+            density = rng.choice([0.0, 0.3, 0.7, 0.95, 1.0])
+            completed_dates = set()
+            for days_ago in range(rng.randint(0, 150)):
+                date = today - timedelta(days=days_ago)
+                completed = rng.random() < density
+                # Unchecked rows must not count towards a streak
+                if completed or rng.random() < 0.2:
+                    completions.append(HabitCompletion(habit=habit, date=date, completed=completed))
+                if completed:
+                    completed_dates.add(date)
+            expected[habit.pk] = (
+                walk_current_streak(completed_dates, today),
+                walk_longest_streak(completed_dates),
+            )
+        HabitCompletion.objects.bulk_create(completions)
+
+        with self.assertNumQueries(2):
+            habits = Habit.objects.filter(user=user).attach_streaks()
+
+        for habit in habits:
+            self.assertEqual(
+                (habit.get_current_streak(), habit.longest_streak),
+                expected[habit.pk],
+                habit.name,
+            )
+
+    def test_attach_streaks_agrees_with_incremental_state(self):
+        user = User.objects.create_user('toggler')
+        habit = Habit.objects.create(user=user, name='Read')
+        today = timezone.now().date()
+
+        for days_ago in [5, 4, 3, 1, 0, 4, 2]:
+            date = today - timedelta(days=days_ago)
+            completion, created = HabitCompletion.objects.get_or_create(
+                habit=habit, date=date, defaults={'completed': True}
+            )
+            if not created:
+                completion.completed = not completion.completed
+                completion.save()
+            habit.apply_completion(date, completion.completed)
+
+        [loaded] = Habit.objects.filter(pk=habit.pk).attach_streaks()
+        habit.refresh_from_db()
+        for field in Habit.STREAK_FIELDS:
+            self.assertEqual(getattr(habit, field), getattr(loaded, field), field)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BitmapHelperTests(TestCase):
+    def test_popcount_window_edges(self):
+        # Days 7 and 8 sit on either side of the first byte boundary
+        bits = 1 << 7 | 1 << 8
+        self.assertEqual(popcount(bits, 7, 8), 2)
+        self.assertEqual(popcount(bits, 8, 8), 1)
+        self.assertEqual(popcount(bits, 0, 7), 1)
+        self.assertEqual(popcount(bits, 9, 365), 0)
+        self.assertEqual(popcount(bits, 8, 7), 0)
+        # December 31st of a leap year is the last day index
+        self.assertEqual(popcount(1 << 365), 1)
+        self.assertEqual(popcount(1 << 365, 0, 364), 0)
+
+    def test_run_length(self):
+        bits = 0b1111 << 6  # days 6 to 9
+        self.assertEqual(run_length(bits, 9), 4)
+        self.assertEqual(run_length(bits, 7), 2)
+        self.assertEqual(run_length(bits, 10), 0)
+        self.assertEqual(run_length(bits, 5), 0)
+        # A run reaching day 0 covers the whole window
+        self.assertEqual(run_length((1 << 16) - 1, 15), 16)
+
+    def test_streaks_and_counts_cross_years(self):
+        bitmaps = {
+            2023: 1 << 363 | 1 << 364,  # December 30th and 31st
+            2024: 0b11,  # January 1st and 2nd
+        }
+        self.assertEqual(streak_ending(bitmaps, date(2024, 1, 2)), 4)
+        self.assertEqual(streak_ending(bitmaps, date(2024, 1, 3)), 0)
+        self.assertEqual(streak_ending(bitmaps, date(2023, 12, 30)), 1)
+        self.assertEqual(count_completions(bitmaps, date(2023, 12, 31), date(2024, 1, 1)), 2)
+        self.assertEqual(count_completions(bitmaps, date(2023, 1, 1), date(2024, 12, 31)), 4)
+
+    def test_rebuild_invalidates_each_users_snapshots(self):
+        habits = [Habit.objects.create(user=User.objects.create_user(name), name='Read') for name in ['ann', 'bob']]
+        receiver = mock.Mock()
+        user_data_changed.connect(receiver)
+        try:
+            rebuild_bitmaps(habits)
+        finally:
+            user_data_changed.disconnect(receiver)
+        self.assertEqual(
+            sorted(call.kwargs['user_id'] for call in receiver.call_args_list),
+            sorted(habit.user_id for habit in habits)
+        )
+
+    def test_perfect_days_keeps_days_every_habit_was_done(self):
+        self.assertEqual(perfect_days([]), 0)
+        self.assertEqual(perfect_days([0b1011]), 0b1011)
+        self.assertEqual(perfect_days([0b1011, 0b0111, 1 << 8 | 0b11]), 0b11)
+        # A habit without a bitmap for the year clears every day
+        self.assertEqual(perfect_days([0b11, 0]), 0)
+
+    def test_set_completion_bit_sets_and_clears(self):
+        habit = Habit.objects.create(user=User.objects.create_user('bits'), name='Read')
+        # Day indexes 7 and 8, on either side of a byte boundary
+        first, second = date(2024, 1, 8), date(2024, 1, 9)
+
+        # Clearing a day without a bitmap row leaves no row behind
+        set_completion_bit(habit.pk, second, False)
+        self.assertEqual(load_bitmaps([habit], [2024])[habit.pk], {})
+
+        set_completion_bit(habit.pk, first, True)
+        set_completion_bit(habit.pk, second, True)
+        self.assertEqual(load_bitmaps([habit], [2024])[habit.pk][2024], 1 << 7 | 1 << 8)
+        set_completion_bit(habit.pk, second, False)
+        self.assertEqual(load_bitmaps([habit], [2024])[habit.pk][2024], 1 << 7)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AchievementEngineTests(TestCase):
+    # Earned set, habit count, streaks, completion count, perfect days, insert,
+    # the inserted rows, then the points ledger write and running total update in a savepoint
+    TOGGLE_QUERY_BUDGET = 11
+
+    def make_user(self, username, habit_count, history_days):
+        user = User.objects.create_user(username)
+        today = timezone.now().date()
+        habits = [Habit.objects.create(user=user, name=f'Habit {i}') for i in range(habit_count)]
+        Habit.objects.filter(user=user).update(created_at=timezone.now() - timedelta(days=history_days))
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(habit=habit, date=today - timedelta(days=days_ago), completed=True)
+            for habit in habits
+            for days_ago in range(history_days)
+        ])
+        rebuild_streaks(habits)
+        rebuild_daily_stats(user)
+        return user
+
+    def toggle_queries(self, user):
+        with CaptureQueriesContext(connection) as queries:
+            check_and_award_achievements(user, [COMPLETION_TOGGLED])
+        return len(queries)
+
+    def test_toggle_query_count_is_bounded(self):
+        small = self.toggle_queries(self.make_user('small', 1, 2))
+        large = self.toggle_queries(self.make_user('large', 40, 2))
+
+        self.assertLessEqual(large, self.TOGGLE_QUERY_BUDGET)
+        self.assertEqual(small, large)
+
+    def test_awards_rules_matching_event(self):
+        user = self.make_user('streaker', 2, 7)
+
+        awarded = check_and_award_achievements(user, [COMPLETION_TOGGLED])
+
+        self.assertEqual(
+            {achievement.achievement_type for achievement in awarded},
+            {'first_habit', 'streak_3', 'streak_7', 'complete_10', 'perfect_week'},
+        )
+        self.assertEqual(Achievement.objects.filter(user=user).count(), 5)
+
+    def test_earned_rules_are_skipped(self):
+        user = self.make_user('creator', 1, 0)
+        check_and_award_achievements(user, [HABIT_CREATED])
+
+        # Only the earned set is read once first_habit is already awarded
+        with self.assertNumQueries(1):
+            self.assertEqual(check_and_award_achievements(user, [HABIT_CREATED]), [])
+
+    def test_achievements_inserted_concurrently_are_not_credited(self):
+        user = self.make_user('racer', 1, 0)
+        real_habit_count = AchievementContext.habit_count.func
+
+        def habit_count(context):
+            # Another check awards first_habit after this one read the earned set
+            Achievement.objects.create(user=user, achievement_type='first_habit')
+            return real_habit_count(context)
+
+        with mock.patch.object(AchievementContext, 'habit_count', property(habit_count)):
+            self.assertEqual(check_and_award_achievements(user, [HABIT_CREATED]), [])
+        self.assertEqual(get_user_points(user), 0)
+
+
+@override_settings(DEFERRED_JOBS=True)
+@override_settings(CACHES=TEST_CACHES)
+class DeferredJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('runner', password='secret')
+        self.client.force_login(self.user)
+        self.habits = [Habit.objects.create(user=self.user, name=f'Habit {i}') for i in range(3)]
+
+    def test_rapid_toggles_collapse_into_one_job(self):
+        for _ in range(5):
+            for habit in self.habits:
+                self.client.post(f'/habits/{habit.pk}/complete/')
+
+        self.assertEqual(DeferredJob.objects.count(), 1)
+        self.assertFalse(Achievement.objects.exists())
+
+        self.assertEqual(process_jobs(), 1)
+        self.assertFalse(DeferredJob.objects.exists())
+        self.assertTrue(Achievement.objects.filter(user=self.user, achievement_type='first_habit').exists())
+
+    def test_failed_jobs_are_kept_for_a_retry(self):
+        self.client.post(f'/habits/{self.habits[0].pk}/complete/')
+
+        with mock.patch.dict(TASKS, achievements=mock.Mock(side_effect=RuntimeError)):
+            with self.assertLogs('habits.job_service', 'ERROR'):
+                self.assertEqual(process_jobs(), 1)
+        job = DeferredJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        # Backing off, so the next pass does not pick it up
+        self.assertEqual(process_jobs(), 0)
+
+        job.run_after = timezone.now()
+        job.save()
+        self.assertEqual(process_jobs(), 1)
+        self.assertFalse(DeferredJob.objects.exists())
+        self.assertTrue(Achievement.objects.filter(user=self.user, achievement_type='first_habit').exists())
+
+    def test_jobs_queued_while_running_run_again(self):
+        self.client.post(f'/habits/{self.habits[0].pk}/complete/')
+
+        def toggle_meanwhile(user, events):
+            self.client.post(f'/habits/{self.habits[1].pk}/complete/')
+
+        with mock.patch.dict(TASKS, achievements=toggle_meanwhile):
+            self.assertEqual(process_jobs(), 1)
+        self.assertEqual(DeferredJob.objects.count(), 1)
+        self.assertEqual(process_jobs(), 1)
+        self.assertFalse(DeferredJob.objects.exists())
+
+    def test_new_achievements_are_announced_once(self):
+        self.client.post(f'/habits/{self.habits[0].pk}/complete/')
+        process_jobs()
+
+        response = self.client.get('/')
+        self.assertContains(response, 'Achievement Unlocked: First Habit Created')
+
+        response = self.client.get('/')
+        self.assertNotContains(response, 'Achievement Unlocked')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PointsLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('scorer', password='secret')
+        self.client.force_login(self.user)
+
+    def test_ledger_matches_source_tables_after_mixed_writes(self):
+        for name in ['Read', 'Run', 'Write']:
+            self.client.post('/habits/create/', {'name': name, 'category': 'other'})
+        read, run, write = Habit.objects.filter(user=self.user).order_by('pk')
+
+        # Give Read a streak running into today
+        today = timezone.now().date()
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(habit=read, date=today - timedelta(days=days_ago), completed=True)
+            for days_ago in range(1, 4)
+        ])
+        read.rebuild_streak()
+        reconcile_points(self.user, fix=True)
+
+        self.client.post(f'/habits/{read.pk}/complete/')
+        self.client.post(f'/habits/{run.pk}/complete/')
+        self.client.post(f'/habits/{run.pk}/complete/')
+        self.client.post(f'/habits/{write.pk}/complete/')
+        self.client.post(f'/habits/{write.pk}/delete/')
+
+        result = reconcile_points(self.user)
+        self.assertEqual(result['ledger'], result['expected'])
+        self.assertEqual(result['total'], result['expected'])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_points(self.user), result['expected'])
+
+    def test_lapsed_streak_bonus_is_settled(self):
+        habit = Habit.objects.create(user=self.user, name='Stretch')
+        yesterday = timezone.now().date() - timedelta(days=1)
+        HabitCompletion.objects.create(habit=habit, date=yesterday, completed=True)
+        habit.rebuild_streak()
+        reconcile_points(self.user, fix=True)
+
+        # The streak lapses once the last completion is two days old
+        Habit.objects.filter(pk=habit.pk).update(last_completed_date=yesterday - timedelta(days=1))
+        UserPoints.objects.filter(user=self.user).update(settled_on=yesterday)
+
+        self.assertEqual(get_user_points(self.user), expected_points(self.user))
+
+    def test_settling_twice_in_a_day_takes_back_once(self):
+        habit = Habit.objects.create(user=self.user, name='Stretch', streak_points=4)
+        Habit.objects.filter(pk=habit.pk).update(last_completed_date=timezone.now().date() - timedelta(days=3))
+        UserPoints.objects.filter(user=self.user).update(total=4, settled_on=None)
+
+        settle_streak_points(self.user)
+        # A request that read settled_on before the first settle committed
+        Habit.objects.filter(pk=habit.pk).update(streak_points=4)
+        settle_streak_points(self.user)
+
+        self.assertEqual(UserPoints.objects.get(user=self.user).total, 0)
+        self.assertEqual(PointsEntry.objects.filter(user=self.user, reason='streak').count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PerfectDayTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('perfectionist', password='secret')
+        self.client.force_login(self.user)
+        self.habits = [Habit.objects.create(user=self.user, name=f'Habit {i}') for i in range(3)]
+        Habit.objects.filter(user=self.user).update(created_at=timezone.now() - timedelta(days=10))
+        today = timezone.now().date()
+        # Every habit done for the previous six days
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(habit=habit, date=today - timedelta(days=days_ago), completed=True)
+            for habit in self.habits
+            for days_ago in range(1, 7)
+        ])
+        rebuild_daily_stats(self.user)
+
+    def test_check_perfect_streak_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertFalse(check_perfect_streak(self.user, days=7))
+
+        for habit in self.habits:
+            HabitCompletion.objects.create(habit=habit, completed=True)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(check_perfect_streak(self.user, days=7))
+        self.assertFalse(check_perfect_streak(self.user, days=8))
+
+    def test_perfect_streak_counter_follows_toggles(self):
+        for habit in self.habits:
+            self.client.post(f'/habits/{habit.pk}/complete/')
+        self.assertEqual(perfect_streak_length(self.user), 7)
+
+        self.client.post(f'/habits/{self.habits[0].pk}/complete/')
+        self.assertEqual(perfect_streak_length(self.user), 0)
+
+        self.client.post(f'/habits/{self.habits[0].pk}/complete/')
+        self.assertEqual(perfect_streak_length(self.user), 7)
+        self.assertTrue(Achievement.objects.filter(user=self.user, achievement_type='perfect_week').exists())
+
+        rebuild_daily_stats(self.user)
+        self.assertEqual(perfect_streak_length(self.user), 7)
+
+    def test_rebuild_invalidates_snapshots(self):
+        receiver = mock.Mock()
+        user_data_changed.connect(receiver)
+        try:
+            rebuild_daily_stats(self.user)
+        finally:
+            user_data_changed.disconnect(receiver)
+        receiver.assert_called_once_with(signal=user_data_changed, sender=DailyUserStats, user_id=self.user.pk)
+
+    def test_changing_a_past_day_renumbers_the_run_after_it(self):
+        today = timezone.now().date()
+        last_six_days = [today - timedelta(days=days_ago) for days_ago in range(6, 0, -1)]
+
+        set_completions(self.user, {self.habits[0].pk: False}, today - timedelta(days=3))
+        self.assertEqual([perfect_streak_length(self.user, day) for day in last_six_days], [1, 2, 3, 0, 1, 2])
+
+        set_completions(self.user, {self.habits[0].pk: True}, today - timedelta(days=3))
+        self.assertEqual([perfect_streak_length(self.user, day) for day in last_six_days], [1, 2, 3, 4, 5, 6])
+
+    def test_deleted_habits_completions_do_not_count(self):
+        self.client.post(f'/habits/{self.habits[0].pk}/complete/')
+        self.client.post(f'/habits/{self.habits[0].pk}/delete/')
+        self.client.post(f'/habits/{self.habits[1].pk}/complete/')
+        # One of the two remaining habits is done today
+        self.assertEqual(perfect_streak_length(self.user), 0)
+
+        self.client.post(f'/habits/{self.habits[2].pk}/complete/')
+        self.assertEqual(perfect_streak_length(self.user), 7)
+        stats = DailyUserStats.objects.get(user=self.user, date=timezone.now().date())
+        self.assertEqual((stats.completions, stats.active_habits), (2, 2))
+
+        rebuild_daily_stats(self.user)
+        stats = DailyUserStats.objects.get(user=self.user, date=timezone.now().date())
+        self.assertEqual((stats.completions, stats.active_habits), (2, 2))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TodayAnnotationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lister', password='secret')
+        self.client.force_login(self.user)
+        # The first page load also checks for unannounced achievements
+        self.client.get('/habits/')
+
+    def list_queries(self, habit_count):
+        habits = Habit.objects.bulk_create([Habit(user=self.user, name='Habit') for i in range(habit_count)])
+        HabitCompletion.objects.bulk_create([HabitCompletion(habit=habit, completed=True) for habit in habits[::2]])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/habits/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_habit_list_queries_do_not_grow_with_habits(self):
+        self.assertEqual(self.list_queries(1), self.list_queries(100))
+
+    def test_annotations_match_queries(self):
+        habits = [Habit.objects.create(user=self.user, name=name) for name in ['Read', 'Run']]
+        HabitCompletion.objects.create(habit=habits[0], completed=True)
+        HabitCompletion.objects.create(habit=habits[0], date=timezone.now().date() - timedelta(days=1), completed=True)
+        HabitCompletion.objects.create(habit=habits[1], completed=False)
+
+        with self.assertNumQueries(1):
+            annotated = {
+                habit.pk: (habit.is_completed_today(), habit.get_total_completions())
+                for habit in Habit.objects.filter(user=self.user).with_today().with_total_completions()
+            }
+
+        for habit in habits:
+            self.assertEqual(annotated[habit.pk], (habit.is_completed_today(), habit.get_total_completions()))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkCompletionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('morning', password='secret')
+        self.client.force_login(self.user)
+        for name in [f'Habit {i}' for i in range(12)]:
+            self.client.post('/habits/create/', {'name': name, 'category': 'health'})
+        self.habits = list(Habit.objects.filter(user=self.user).order_by('pk'))
+
+        # A running streak on the first habit and one already done today
+        yesterday = timezone.now().date() - timedelta(days=1)
+        HabitCompletion.objects.create(habit=self.habits[0], date=yesterday, completed=True)
+        self.habits[0].rebuild_streak()
+        rebuild_bitmaps(self.habits)
+        rebuild_daily_stats(self.user)
+        reconcile_points(self.user, fix=True)
+        self.client.post(f'/habits/{self.habits[1].pk}/complete/')
+
+    def complete_selected(self, habits, completed=True):
+        return self.client.post('/habits/complete/', {
+            'habits': [habit.pk for habit in habits],
+            'completed': 'true' if completed else 'false',
+        })
+
+    def assertDerivedStateConsistent(self):
+        today = timezone.now().date()
+        stored = {habit.pk: habit for habit in Habit.objects.filter(user=self.user)}
+        for habit in Habit.objects.filter(user=self.user).attach_streaks():
+            for field in Habit.STREAK_FIELDS:
+                self.assertEqual(getattr(stored[habit.pk], field), getattr(habit, field), field)
+
+        bitmaps = load_bitmaps(self.habits, [today.year])
+        for habit in self.habits:
+            self.assertEqual(
+                bool(bitmaps[habit.pk].get(today.year, 0) >> (today.timetuple().tm_yday - 1) & 1),
+                HabitCompletion.objects.filter(habit=habit, date=today, completed=True).exists(),
+            )
+
+        completions = HabitCompletion.objects.filter(habit__user=self.user, date=today, completed=True).count()
+        self.assertEqual(DailyUserStats.objects.get(user=self.user, date=today).completions, completions)
+
+        result = reconcile_points(self.user)
+        self.assertEqual(result['ledger'], result['expected'])
+        self.assertEqual(result['total'], result['expected'])
+
+    def test_completes_and_uncompletes_selection(self):
+        response = self.complete_selected(self.habits)
+        self.assertRedirects(response, '/')
+        self.assertEqual(HabitCompletion.objects.filter(habit__user=self.user, completed=True).count(), 13)
+        self.assertEqual(Habit.objects.get(pk=self.habits[0].pk).current_streak, 2)
+        self.assertDerivedStateConsistent()
+
+        self.complete_selected(self.habits[:6], completed=False)
+        self.assertEqual(HabitCompletion.objects.filter(habit__user=self.user, completed=True).count(), 7)
+        self.assertDerivedStateConsistent()
+
+    def test_mixed_states_in_one_call(self):
+        today = timezone.now().date()
+        states = {habit.pk: i % 2 == 0 for i, habit in enumerate(self.habits)}
+        changed = set_completions(self.user, states, today)
+
+        # Habit 1 was already done today, habit 0 and the other even ones get completed
+        self.assertEqual(len(changed), 7)
+        self.assertEqual(
+            set(HabitCompletion.objects.filter(habit__user=self.user, date=today, completed=True).values_list('habit', flat=True)),
+            {pk for pk, completed in states.items() if completed}
+        )
+        self.assertDerivedStateConsistent()
+
+    def test_uncompleting_rebuilds_streaks_in_one_query(self):
+        today = timezone.now().date()
+        set_completions(self.user, {habit.pk: True for habit in self.habits}, today)
+
+        def uncomplete_queries(habits):
+            with CaptureQueriesContext(connection) as queries:
+                set_completions(self.user, {habit.pk: False for habit in habits}, today)
+            return len(queries)
+
+        # The first call also ends today's perfect day
+        uncomplete_queries(self.habits[11:])
+        self.assertEqual(uncomplete_queries(self.habits[2:4]), uncomplete_queries(self.habits[4:11]))
+        self.assertDerivedStateConsistent()
+
+    def test_other_users_habits_are_ignored(self):
+        other = User.objects.create_user('other')
+        foreign = Habit.objects.create(user=other, name='Not mine')
+
+        self.complete_selected([foreign])
+        self.assertFalse(HabitCompletion.objects.filter(habit=foreign).exists())
+
+    @override_settings(DEFERRED_JOBS=True)
+    def test_one_achievement_pass(self):
+        DeferredJob.objects.all().delete()
+        self.complete_selected(self.habits)
+        self.assertEqual(DeferredJob.objects.count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SyncApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mobile', password='secret')
+        self.client.force_login(self.user)
+        self.habits = [Habit.objects.create(user=self.user, name=name) for name in ['Read', 'Run']]
+        self.todo = Todo.objects.create(user=self.user, title='Groceries')
+        reconcile_points(self.user, fix=True)
+        self.today = timezone.now().date()
+
+    def sync(self, operations, since=None):
+        response = self.client.post(
+            '/api/sync/',
+            json.dumps({'operations': operations, 'since': since}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_batch_is_applied_once(self):
+        operations = [
+            {'key': 'a', 'type': 'completion.set', 'habit': self.habits[0].pk, 'date': self.today.isoformat(), 'completed': True},
+            {'key': 'b', 'type': 'completion.set', 'habit': self.habits[1].pk, 'date': self.today.isoformat(), 'completed': True},
+            {'key': 'c', 'type': 'todo.create', 'client_id': 'tmp-1', 'title': 'Call mum', 'priority': 'high'},
+            {'key': 'd', 'type': 'todo.toggle', 'todo': self.todo.pk, 'completed': True},
+        ]
+        result = self.sync(operations)
+
+        self.assertEqual(sorted(result['applied']), ['a', 'b', 'c', 'd'])
+        self.assertEqual(HabitCompletion.objects.filter(habit__user=self.user, completed=True).count(), 2)
+        self.assertTrue(Todo.objects.get(pk=self.todo.pk).completed)
+        created = Todo.objects.get(pk=result['created']['tmp-1'])
+        self.assertEqual((created.title, created.priority), ('Call mum', 'high'))
+        self.assertEqual(Habit.objects.get(pk=self.habits[0].pk).current_streak, 1)
+        self.assertEqual(reconcile_points(self.user)['total'], expected_points(self.user))
+
+        # A retry after a lost response changes nothing
+        retry = self.sync(operations)
+        self.assertEqual(sorted(retry['duplicates']), ['a', 'b', 'c', 'd'])
+        self.assertEqual(Todo.objects.filter(user=self.user).count(), 2)
+
+    def test_delta_since_token(self):
+        token = self.sync([])['token']
+        other = Todo.objects.create(user=self.user, title='Later')
+        result = self.sync([
+            {'key': 'x', 'type': 'todo.delete', 'todo': self.todo.pk},
+            {'key': 'y', 'type': 'completion.set', 'habit': self.habits[0].pk, 'date': self.today.isoformat()},
+        ], since=token)
+
+        self.assertEqual(result['deleted_todos'], [self.todo.pk])
+        self.assertEqual([todo['id'] for todo in result['todos']], [other.pk])
+        self.assertEqual(result['completions'], [[self.habits[0].pk, self.today.isoformat(), True]])
+
+    def test_invalid_operations_are_rejected(self):
+        foreign = Habit.objects.create(user=User.objects.create_user('other'), name='Not mine')
+        result = self.sync([
+            {'key': 'a', 'type': 'completion.set', 'habit': foreign.pk, 'date': self.today.isoformat()},
+            {'key': 'b', 'type': 'completion.set', 'habit': self.habits[0].pk, 'date': '2024-02-30'},
+            {'key': 'c', 'type': 'habit.delete'},
+            {'type': 'todo.toggle', 'todo': self.todo.pk},
+        ])
+
+        self.assertEqual(result['applied'], [])
+        self.assertEqual(len(result['rejected']), 4)
+        self.assertFalse(HabitCompletion.objects.exists())
+
+    def test_out_of_range_dates_and_non_boolean_states_are_rejected(self):
+        habit = self.habits[0].pk
+        created = timezone.localtime(self.habits[0].created_at).date()
+        result = self.sync([
+            {'key': 'a', 'type': 'completion.set', 'habit': habit, 'date': (self.today + timedelta(days=1)).isoformat()},
+            {'key': 'b', 'type': 'completion.set', 'habit': habit, 'date': (created - timedelta(days=1)).isoformat()},
+            {'key': 'c', 'type': 'completion.set', 'habit': habit, 'date': self.today.isoformat(), 'completed': 'false'},
+            {'key': 'd', 'type': 'todo.toggle', 'todo': self.todo.pk, 'completed': 'false'},
+            {'key': 'e', 'type': 'completion.set', 'habit': self.habits[1].pk, 'date': self.today.isoformat(), 'completed': False},
+        ])
+
+        self.assertEqual(result['applied'], ['e'])
+        self.assertEqual(sorted(entry['key'] for entry in result['rejected']), ['a', 'b', 'c', 'd'])
+        self.assertFalse(HabitCompletion.objects.filter(completed=True).exists())
+        self.assertFalse(Todo.objects.get(pk=self.todo.pk).completed)
+
+    def test_malformed_fields_only_reject_their_operation(self):
+        result = self.sync([
+            {'key': 'a', 'type': ['completion.set'], 'habit': self.habits[0].pk},
+            {'key': 'b', 'type': 'completion.set', 'habit': [self.habits[0].pk], 'date': self.today.isoformat()},
+            {'key': 'c', 'type': 'todo.create', 'title': 'Bad priority', 'priority': {'level': 'high'}},
+            {'key': 'd', 'type': 'todo.toggle', 'todo': {'id': self.todo.pk}},
+            {'key': 'e', 'type': 'todo.create', 'title': 'Bad due date', 'due_date': 'next week'},
+            {'key': 'f', 'type': 'todo.create', 'title': 'Bad description', 'description': ['x']},
+            {'key': 'g', 'type': 'completion.set', 'habit': self.habits[1].pk, 'date': self.today.isoformat(), 'at': 'soon'},
+            {'key': ['h'], 'type': 'todo.delete', 'todo': self.todo.pk},
+            {'key': 'i', 'type': 'completion.set', 'habit': self.habits[0].pk, 'date': self.today.isoformat()},
+        ])
+
+        self.assertEqual(result['applied'], ['i'])
+        self.assertEqual(len(result['rejected']), 8)
+        self.assertEqual(Todo.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(HabitCompletion.objects.filter(completed=True).count(), 1)
+
+    def test_requires_login_and_json(self):
+        response = Client().post('/api/sync/', '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+        response = self.client.post('/api/sync/', 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ImportHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('importer', password='secret')
+        self.client.force_login(self.user)
+        self.today = timezone.now().date()
+
+    def test_csv_upload_skips_invalid_rows(self):
+        Habit.objects.create(user=self.user, name='Read')
+        rows = ['habit,date,completed,notes']
+        rows += [f'Read,{self.today - timedelta(days=offset)},yes,' for offset in range(5)]
+        rows += [f'Meditate,{self.today - timedelta(days=1)},1,calm', 'Read,yesterday,yes,', ',2024-01-01,yes,']
+        rows += [f'Read,{self.today + timedelta(days=1)},yes,']
+        upload = SimpleUploadedFile('history.csv', '\n'.join(rows).encode(), content_type='text/csv')
+
+        response = self.client.post('/habits/import/', {'file': upload, 'format': 'csv'})
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+
+        read = Habit.objects.get(user=self.user, name='Read')
+        self.assertEqual((read.current_streak, read.longest_streak), (5, 5))
+        self.assertEqual(Habit.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(HabitCompletion.objects.filter(habit__user=self.user).count(), 6)
+        self.assertEqual(DailyUserStats.objects.get(user=self.user, date=self.today - timedelta(days=1)).completions, 2)
+        self.assertEqual(reconcile_points(self.user)['total'], expected_points(self.user))
+        self.assertTrue(Achievement.objects.filter(user=self.user, achievement_type='streak_3').exists())
+
+    def test_future_dates_are_skipped(self):
+        tomorrow = self.today + timedelta(days=1)
+        rows = f'habit,date,completed\nRead,{self.today},yes\nRead,{tomorrow},yes\n'
+        result = import_history(self.user, io.BytesIO(rows.encode()), 'csv')
+
+        self.assertEqual((result['completions_imported'], result['error_count']), (1, 1))
+        self.assertEqual(result['errors'], [f'Row 2: date {tomorrow} is in the future'])
+        self.assertFalse(HabitCompletion.objects.filter(date=tomorrow).exists())
+
+    def test_ndjson_export_round_trip(self):
+        source = User.objects.create_user('source')
+        habits = [Habit.objects.create(user=source, name=name, category='health') for name in ['Walk', 'Stretch']]
+        for offset in range(20):
+            date = self.today - timedelta(days=offset)
+            set_completions(source, {habit.pk: True for habit in habits if offset % 7 or habit.name == 'Walk'}, date)
+
+        export = b''.join(export_chunks(source, 'ndjson'))
+        # Small batches so habits and completions span several transactions
+        result = import_history(self.user, io.BytesIO(export), 'ndjson', batch_size=7)
+        self.assertEqual((result['habits_created'], result['completions_imported'], result['error_count']), (2, 37, 0))
+
+        # Importing the same file again adds nothing
+        again = import_history(self.user, io.BytesIO(export), 'ndjson', batch_size=7)
+        self.assertEqual((again['habits_created'], again['completions_imported']), (0, 0))
+
+        for habit in habits:
+            habit.refresh_from_db()
+            imported = Habit.objects.get(user=self.user, name=habit.name)
+            self.assertEqual(imported.category, 'health')
+            self.assertEqual(
+                [getattr(imported, field) for field in Habit.STREAK_FIELDS],
+                [getattr(habit, field) for field in Habit.STREAK_FIELDS]
+            )
+            years = {self.today.year, (self.today - timedelta(days=19)).year}
+            self.assertEqual(load_bitmaps([imported], years)[imported.pk], load_bitmaps([habit], years)[habit.pk])
+        self.assertEqual(
+            list(DailyUserStats.objects.filter(user=self.user).values_list('date', 'completions')),
+            list(DailyUserStats.objects.filter(user=source).values_list('date', 'completions'))
+        )
+        self.assertEqual(reconcile_points(self.user)['total'], expected_points(self.user))
+
+    def test_undecodable_and_non_text_rows_are_skipped(self):
+        day = (self.today - timedelta(days=1)).isoformat()
+        lines = [json.dumps({'habit': 'Walk', 'date': day}).encode()]
+        lines.append(b'{"habit": "Walk", "date": "' + day.encode() + b'", "notes": "caf\xe9"}')
+        lines.append(json.dumps({'habit': 'Swim', 'date': day, 'category': ['health']}).encode())
+        lines.append(json.dumps({'habit': {'name': 'Run'}, 'date': day}).encode())
+        lines.append(json.dumps({'habit': 'Walk', 'date': self.today.isoformat()}).encode())
+        result = import_history(self.user, io.BytesIO(b'\n'.join(lines)), 'ndjson', batch_size=2)
+
+        self.assertEqual((result['completions_imported'], result['error_count']), (2, 3))
+        self.assertEqual(list(Habit.objects.filter(user=self.user).values_list('name', flat=True)), ['Walk'])
+
+        rows = b'habit,date\nRead,' + day.encode() + b'\nR\xffad,' + day.encode() + b'\n'
+        result = import_history(self.user, io.BytesIO(rows), 'csv')
+        self.assertEqual(result['errors'], ['Row 2: invalid UTF-8'])
+
+    def test_failed_read_still_rebuilds_committed_batches(self):
+        def lines():
+            for offset in range(6):
+                yield json.dumps({'habit': 'Walk', 'date': (self.today - timedelta(days=offset)).isoformat()}).encode()
+            raise OSError('connection reset')
+
+        with self.assertRaises(OSError):
+            import_history(self.user, lines(), 'ndjson', batch_size=4)
+
+        walk = Habit.objects.get(user=self.user, name='Walk')
+        self.assertEqual(walk.current_streak, 6)
+        self.assertEqual(DailyUserStats.objects.filter(user=self.user).count(), 6)
+        self.assertEqual(reconcile_points(self.user)['total'], expected_points(self.user))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BenchmarkCommandTests(TestCase):
+    def test_loadtest_only_seeds_a_scratch_database(self):
+        with mock.patch.dict('os.environ', {'DATABASE_URL': 'postgres://example/habits', 'SQLITE_PATH': ''}):
+            with self.assertRaisesMessage(CommandError, 'DATABASE_URL'):
+                call_command('loadtest', '--allow-seed')
+        with mock.patch.dict('os.environ', {'DATABASE_URL': '', 'SQLITE_PATH': ''}):
+            with self.assertRaisesMessage(CommandError, 'SQLITE_PATH'):
+                call_command('loadtest')
+        self.assertFalse(User.objects.filter(username__startswith='load-').exists())
+
+    def test_allow_database_url_only_accepts_localhost(self):
+        with mock.patch.dict('os.environ', {'DATABASE_URL': 'postgres://db.example.com/habits', 'SQLITE_PATH': ''}):
+            with self.assertRaisesMessage(CommandError, 'localhost'):
+                call_command('loadtest', '--allow-database-url')
+        with mock.patch.dict('os.environ', {'DATABASE_URL': 'postgres://bench@localhost:5432/habits', 'SQLITE_PATH': ''}):
+            check_scratch_database(False, allow_database_url=True)
+
+    def test_startup_bench_only_seeds_a_scratch_database(self):
+        with mock.patch.dict('os.environ', {'DATABASE_URL': 'postgres://example/habits', 'SQLITE_PATH': ''}):
+            with self.assertRaisesMessage(CommandError, 'DATABASE_URL'):
+                call_command('startup_bench', '--allow-seed')
+        self.assertFalse(User.objects.filter(username='startup-bench').exists())
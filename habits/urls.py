@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path('', views.habit_list, name='habit-list'),
     path('create/', views.habit_create, name='habit-create'),
+    path('complete/', views.habit_complete_selected, name='habit-complete-selected'),
+    path('import/', views.habit_import, name='habit-import'),
     path('<int:pk>/update/', views.habit_update, name='habit-update'),
     path('<int:pk>/delete/', views.habit_delete, name='habit-delete'),
     path('<int:pk>/complete/', views.habit_complete, name='habit-complete'),
@@ -2,13 +2,20 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
+from config.database import read_from_replica
 from .models import Habit, HabitCompletion
-from .forms import HabitForm
-from .achievement_service import check_and_award_achievements
+from .forms import HabitForm, HistoryImportForm
+from .achievement_service import COMPLETION_TOGGLED, HABIT_CREATED
+from .completion_service import set_completions
+from .import_service import import_history
+from .job_service import dispatch
+from .points_service import record_completion_points, record_habit_created, record_habit_deleted
+from .rollup_service import record_completion, refresh_active_habits
 
 @login_required
+@read_from_replica
 def habit_list(request):
-    habits = Habit.objects.filter(user=request.user, is_active=True)
+    habits = Habit.objects.filter(user=request.user, is_active=True).with_today().with_total_completions()
     return render(request, 'habits/habit_list.html', {'habits': habits})
 
 @login_required
@@ -19,6 +26,9 @@ def habit_create(request):
             habit = form.save(commit=False)
             habit.user = request.user
             habit.save()
+            refresh_active_habits(request.user)
+            record_habit_created(habit)
+            dispatch(request.user, 'achievements', HABIT_CREATED)
             messages.success(request, 'Habit created successfully!')
             return redirect('dashboard')
     else:
@@ -48,6 +58,8 @@ def habit_delete(request, pk):
     if request.method == 'POST':
         habit.is_active = False
         habit.save()
+        refresh_active_habits(request.user)
+        record_habit_deleted(habit)
         messages.success(request, 'Habit deleted successfully!')
         return redirect('dashboard')
     
@@ -70,19 +82,62 @@ def habit_complete(request, pk):
         completion.completed = not completion.completed
         completion.save()
     
-    # Check for new achievements
-    new_achievements = check_and_award_achievements(request.user)
+    # Keep the stored streak, daily rollup and points in step with today's toggle
+    habit.apply_completion(today, completion.completed)
+    if habit.is_active:
+        record_completion(request.user, today, 1 if completion.completed else -1)
+    record_completion_points(habit, completion.completed)
+    
+    # Check for new achievements, announced on the next page load
+    dispatch(request.user, 'achievements', COMPLETION_TOGGLED)
     
     if completion.completed:
         messages.success(request, f'Great job! {habit.name} completed for today! 🎉')
-        
-        # Notify about new achievements
-        for achievement in new_achievements:
+    else:
+        messages.info(request, f'{habit.name} marked as incomplete.')
+    
+    return redirect('dashboard')
+
+@login_required
+def habit_complete_selected(request):
+    if request.method != 'POST':
+        return redirect('dashboard')
+    
+    habit_ids = [pk for pk in request.POST.getlist('habits') if pk.isdigit()]
+    completed = request.POST.get('completed', 'true') != 'false'
+    
+    # All selected habits in one transaction, then a single achievement pass
+    changed = set_completions(request.user, {pk: completed for pk in habit_ids}, timezone.now().date())
+    if changed:
+        dispatch(request.user, 'achievements', COMPLETION_TOGGLED)
+    
+    if not habit_ids:
+        messages.info(request, 'Select the habits you want to complete first.')
+    elif completed:
+        messages.success(request, f'Great job! {len(changed)} habit{"s" if len(changed) != 1 else ""} completed for today! 🎉')
+    else:
+        messages.info(request, f'{len(changed)} habit{"s" if len(changed) != 1 else ""} marked as incomplete.')
+    
+    return redirect('dashboard')
+
+@login_required
+def habit_import(request):
+    if request.method == 'POST':
+        form = HistoryImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            # Large uploads are already on disk, the importer reads them in batches
+            result = import_history(request.user, form.cleaned_data['file'], form.cleaned_data['format'])
             messages.success(
-                request, 
-                f'🏆 Achievement Unlocked: {achievement.get_achievement_type_display()}!'
+                request,
+                f"Imported {result['completions_imported']} completions and {result['habits_created']} new habits."
             )
+            if result['error_count']:
+                messages.warning(
+                    request,
+                    f"Skipped {result['error_count']} invalid rows. " + ' '.join(result['errors'][:3])
+                )
+            return redirect('dashboard')
     else:
-        messages.info(request, f'{habit.name} marked as incomplete.')
+        form = HistoryImportForm()
     
-    return redirect('dashboard')
\ No newline at end of file
+    return render(request, 'habits/habit_import.html', {'form': form})
\ No newline at end of file
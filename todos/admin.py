@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.utils import timezone
+from habits.signals import user_data_changed
 from .models import Todo
 
 @admin.register(Todo)
@@ -7,11 +9,19 @@ class TodoAdmin(admin.ModelAdmin):
     list_filter = ['completed', 'priority', 'due_date']
     search_fields = ['title', 'description', 'user__username']
     actions = ['mark_completed', 'mark_incomplete']
+
+    def update_todos(self, queryset, **fields):
+        # Read the owners first, a filtered changelist may no longer match after the update
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        queryset.update(updated_at=timezone.now(), **fields)
+        # update() skips the save signals, so invalidate each owner's snapshots here
+        for user_id in user_ids:
+            user_data_changed.send(sender=Todo, user_id=user_id)
     
     def mark_completed(self, request, queryset):
-        queryset.update(completed=True)
+        self.update_todos(queryset, completed=True)
     mark_completed.short_description = "Mark selected todos as completed"
     
     def mark_incomplete(self, request, queryset):
-        queryset.update(completed=False)
+        self.update_todos(queryset, completed=False)
     mark_incomplete.short_description = "Mark selected todos as incomplete"
\ No newline at end of file
@@ -17,6 +17,8 @@ class Todo(models.Model):
     due_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Read by the sync API to send clients what changed since their last sync
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.title
@@ -34,4 +36,18 @@ class Todo(models.Model):
         self.save()
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'updated_at'])]
+
+
+class TodoTombstone(models.Model):
+    """Record of a deleted todo, so syncing clients learn about the deletion"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    todo_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Deleted todo {self.todo_id}"
+    
+    class Meta:
+        indexes = [models.Index(fields=['user', 'deleted_at'])]
@@ -0,0 +1,12 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Todo, TodoTombstone
+
+
+@receiver(post_delete, sender=Todo)
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    # Todos removed along with their user have nobody left to sync to
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is None or origin_model is Todo:
+        TodoTombstone.objects.create(user_id=instance.user_id, todo_id=instance.pk)
@@ -1,3 +1,31 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from habits.signals import user_data_changed
+from .models import Todo
+
+# Tests get a private in-memory cache, so cache.clear() leaves the shared
+# cache directory of a running server alone
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TodoAdminTests(TestCase):
+    def test_bulk_actions_invalidate_each_owner(self):
+        users = [User.objects.create_user(name) for name in ['ann', 'bob']]
+        for user in users + users:
+            Todo.objects.create(user=user, title='Chores')
+        receiver = mock.Mock()
+        user_data_changed.connect(receiver)
+        self.addCleanup(user_data_changed.disconnect, receiver)
+
+        admin.site._registry[Todo].mark_completed(None, Todo.objects.filter(completed=False))
+
+        self.assertFalse(Todo.objects.filter(completed=False).exists())
+        self.assertEqual(
+            sorted(call.kwargs['user_id'] for call in receiver.call_args_list),
+            sorted(user.pk for user in users)
+        )
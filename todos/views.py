@@ -1,6 +1,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from config.database import read_from_replica
 from .models import Todo
 from .forms import TodoForm
 
@@ -8,6 +9,7 @@ from .forms import TodoForm
 # def todo_list(request):
 #     todos = Todo.objects.filter(user=request.user)
 #     return render(request, 'todos/todo_list.html', {'todos': todos})
+@read_from_replica
 def todo_list(request):
     todos = Todo.objects.filter(user=request.user)
 